@@ -8,3 +8,4 @@
 fullbright = False  # Debug, all tiles visible.
 engine: game.engine.Engine
 mouse_pos: Optional[Tuple[int, int]] = None
+realtime = False  # Simulate on a fixed tick instead of on each turn.
@@ -102,6 +102,7 @@ def perform(self) -> None:
             raise game.exceptions.Impossible("You can't go that way.")
         if gamemap.fire[self.dest_xy]:
             gamemap.fire[self.dest_xy] = 0
+            gamemap.fire_changed(self.dest_xy)
         # elif gamemap.tiles[self.dest_xy] == 0:  # Remove walls.
         #    gamemap.tiles[self.dest_xy] = 1
         elif self.target_actor:
@@ -0,0 +1,160 @@
+"""An endless map made of chunks which are generated as the player approaches them.
+
+Only a square window of `span` by `span` chunks centered on the player is kept in memory.  When the player leaves the
+center chunk the window is moved, chunks which leave the window are compressed into a store and chunks which enter it
+are loaded from the store, or generated if they were never visited.  Memory use grows with the explored area instead
+of the size of the world.
+
+Map coordinates are relative to the window and change whenever it moves, entities, AI paths and mouse positions are
+moved with it.
+"""
+from __future__ import annotations
+
+import lzma
+import pickle
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+import g
+import game.components.ai
+import game.engine
+import game.entity
+import game.game_map
+import game.profiler
+import game.simulation
+
+LAYERS = ("tiles", "fire", "fuel", "heat", "smoke", "memory", "explored")
+"""The arrays of a map which are saved with each chunk, other arrays are derived from these."""
+
+
+class ChunkedGameMap(game.game_map.GameMap):
+    """A map which follows the player through an endless world of chunks."""
+
+    def __init__(self, engine: game.engine.Engine, *, seed: int, floor: int, chunk_size: int, span: int):
+        assert span % 2 == 1, "The window needs a center chunk."
+        super().__init__(engine, chunk_size * span, chunk_size * span)
+        self.parent = engine
+        self.seed = seed
+        self.floor = floor
+        self.chunk_size = chunk_size
+        self.span = span
+        self.origin = (-(span // 2), -(span // 2))  # The chunk at the top-left of the window.
+        self.store: Dict[Tuple[int, int], bytes] = {}  # Compressed chunks which have left the window.
+        self.enter_xy = (chunk_size * (span // 2), chunk_size * (span // 2))  # The outdoor corner of chunk 0,0.
+        for i, j in self._window():
+            self._load_chunk(i, j)
+        self.tiles_changed(np.s_[:, :])
+        game.simulation.update_hazard(self)
+
+    def _window(self) -> Iterator[Tuple[int, int]]:
+        """Iterate over the window positions of the loaded chunks."""
+        for j in range(self.span):
+            for i in range(self.span):
+                yield i, j
+
+    def _chunk_index(self, i: int, j: int) -> Tuple[slice, slice]:
+        """Return the index of the chunk at window position `i`, `j`."""
+        size = self.chunk_size
+        return slice(i * size, (i + 1) * size), slice(j * size, (j + 1) * size)
+
+    def _entities_in(self, index: Tuple[slice, slice]) -> List[game.entity.Entity]:
+        """Return the entities in an area, other than the player."""
+        x_slice, y_slice = index
+        return [
+            entity
+            for entity in self.entities
+            if entity is not self.engine.player
+            and x_slice.start <= entity.x < x_slice.stop
+            and y_slice.start <= entity.y < y_slice.stop
+        ]
+
+    def _load_chunk(self, i: int, j: int) -> None:
+        """Fill the window position `i`, `j` with its chunk from the store, or generate it if it's not stored."""
+        import game.procgen
+
+        key = self.origin[0] + i, self.origin[1] + j
+        index = self._chunk_index(i, j)
+        data = self.store.pop(key, None)
+        if data is not None:
+            game.profiler.count("chunks.loaded")
+            chunk = pickle.loads(lzma.decompress(data))
+            layers: Dict[str, Any] = chunk["layers"]
+            entities: List[game.entity.Entity] = chunk["entities"]
+        else:
+            game.profiler.count("chunks.generated")
+            generated = game.procgen.generate_chunk(self.engine, self.chunk_size, self.seed, self.floor, *key)
+            layers = {name: getattr(generated, name) for name in LAYERS}
+            entities = list(generated.entities)
+        for name, layer in layers.items():
+            getattr(self, name)[index] = layer
+        for entity in entities:
+            entity.place(entity.x + index[0].start, entity.y + index[1].start, self)
+
+    def _store_chunk(self, i: int, j: int) -> None:
+        """Compress the chunk at window position `i`, `j` into the store and remove its entities from the map."""
+        key = self.origin[0] + i, self.origin[1] + j
+        index = self._chunk_index(i, j)
+        entities = self._entities_in(index)
+        for entity in entities:
+            entity.place(entity.x - index[0].start, entity.y - index[1].start, None)
+        chunk = {"layers": {name: getattr(self, name)[index].copy() for name in LAYERS}, "entities": entities}
+        self.store[key] = lzma.compress(pickle.dumps(chunk))
+        game.profiler.count("chunks.stored")
+
+    def follow(self, x: int, y: int) -> None:
+        """Move the window once `x`, `y` is far enough outside of its center chunk.
+
+        The window only moves once the position is a quarter of a chunk past the center chunk, so that walking along
+        the edge of a chunk does not move the window back and forth.
+        """
+        size = self.chunk_size
+        low, high = size * (self.span // 2) - size // 4, size * (self.span // 2 + 1) + size // 4
+        shift_x = (x - size * (self.span // 2)) // size if not low <= x < high else 0
+        shift_y = (y - size * (self.span // 2)) // size if not low <= y < high else 0
+        if shift_x or shift_y:
+            with game.profiler.section("chunks.shift"):
+                self._shift(shift_x, shift_y)
+
+    def _shift(self, shift_x: int, shift_y: int) -> None:
+        """Move the window by a number of chunks."""
+        span = self.span
+        for i, j in self._window():
+            if not (0 <= i - shift_x < span and 0 <= j - shift_y < span):
+                self._store_chunk(i, j)
+
+        dx, dy = shift_x * self.chunk_size, shift_y * self.chunk_size
+        for name in LAYERS:
+            layer = getattr(self, name)
+            layer[...] = np.roll(layer, (-dx, -dy), axis=(0, 1))
+        for entity in list(self.entities):
+            entity.move(-dx, -dy)
+            for ai in entity.get_children(game.components.ai.HostileEnemy):
+                ai.path = [(path_x - dx, path_y - dy) for path_x, path_y in ai.path]
+        self.enter_xy = self.enter_xy[0] - dx, self.enter_xy[1] - dy
+        self.downstairs_location = self.downstairs_location[0] - dx, self.downstairs_location[1] - dy
+        self.origin = self.origin[0] + shift_x, self.origin[1] + shift_y
+        mouse_x, mouse_y = self.engine.mouse_location[0] - dx, self.engine.mouse_location[1] - dy
+        if self.in_bounds(mouse_x, mouse_y):
+            self.engine.mouse_location = mouse_x, mouse_y
+        else:
+            self.engine.mouse_location = self.engine.player.x, self.engine.player.y
+        if g.mouse_pos is not None:
+            mouse_x, mouse_y = g.mouse_pos[0] - dx, g.mouse_pos[1] - dy
+            g.mouse_pos = (mouse_x, mouse_y) if self.in_bounds(mouse_x, mouse_y) else None
+
+        for i, j in self._window():
+            if not (0 <= i + shift_x < span and 0 <= j + shift_y < span):
+                self._load_chunk(i, j)
+
+        # Every position has changed, so everything derived from positions is rebuilt.
+        self._path_graph = None
+        self._perception = None
+        self.render_cache = None
+        self.visible[...] = False
+        self.fov_origin = None
+        self.fov_window = (slice(0, 0), slice(0, 0))
+        self.tiles_changed(np.s_[:, :])
+        self.smoke_version += 1
+        self.opacity_version += 1
+        game.simulation.update_hazard(self)
@@ -1,38 +1,128 @@
 from __future__ import annotations
 
+import functools
 import random
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 import numpy as np
 import tcod
 from numpy.typing import NDArray
 
 import game.actions
+import game.constants
 import game.entity
+import game.game_map
+import game.pathfinding
 from game.actions import Action
 from game.node import Node
 
+if TYPE_CHECKING:
+    import game.engine
+
+
+def get_path_cost(gamemap: game.game_map.GameMap, window: game.pathfinding.Window) -> NDArray[np.int32]:
+    """Return the movement cost for a window of the map, including the cost of hazards and blocking entities."""
+    x_slice, y_slice = window
+    # Copy the walkable array.
+    cost: NDArray[np.int32] = np.array(gamemap.tiles[window], dtype=np.int32)
+    # Avoid fire and heat, walls must remain at zero cost so that they stay blocking.
+    cost += gamemap.hazard[window] * (cost != 0)
+
+    for entity in gamemap.entities:
+        x = entity.x - x_slice.start
+        y = entity.y - y_slice.start
+        if not (0 <= x < cost.shape[0] and 0 <= y < cost.shape[1]):
+            continue
+        # Check that an enitiy blocks movement and the cost isn't zero (blocking.)
+        if entity.blocks_movement and cost[x, y]:
+            # Add to the cost of a blocked position.
+            # A lower number means more enemies will crowd behind each other in
+            # hallways.  A higher number means enemies will take longer paths in
+            # order to surround the player.
+            cost[x, y] += 10
+    return cost
+
+
+class TurnSnapshot:
+    """The read-only state which AI decisions are made from during a turn.
+
+    This is captured once per turn before any actor moves, so that decisions can be made in any order or in parallel.
+    """
+
+    def __init__(self, engine: game.engine.Engine):
+        gamemap = engine.game_map
+        self.player_xy = engine.player.x, engine.player.y
+        self.visible = gamemap.visible.view()
+        self.visible.flags.writeable = False
+        self.cost = get_path_cost(gamemap, (slice(0, gamemap.width), slice(0, gamemap.height)))
+        self.cost.flags.writeable = False
+        self.seed = engine.rng.getrandbits(64)
+        # Batch the FOV of every NPC with its own sight radius, unchanged viewers reuse their cached FOV.
+        self.perception = gamemap.perception
+        self.perception.update(
+            (actor.x, actor.y, ai.sight_radius)
+            for actor in gamemap.get_children(game.entity.Actor)
+            for ai in actor.get_children(BaseAI)
+            if ai.sight_radius
+        )
+        if gamemap.width * gamemap.height >= game.constants.hierarchical_path_area:
+            gamemap.path_graph.update()  # Rebuild before the graph is shared between threads.
+
+    def path_cost(self, window: game.pathfinding.Window) -> NDArray[np.int32]:
+        """Return the movement cost for a window of the map at the start of this turn."""
+        return self.cost[window]
+
+    def rng_for(self, entity: game.entity.Entity) -> random.Random:
+        """Return a random generator for an entity which doesn't depend on the order of decisions."""
+        return random.Random(f"{self.seed}:{entity.x}:{entity.y}")
+
 
 class BaseAI(Action, Node):
-    def perform(self) -> None:
-        raise NotImplementedError()
+    sight_radius = 0
+    """How far this AI can see on its own.  If zero then this AI can see the player when the player can see it."""
+
+    def perform(self, snapshot: Optional[TurnSnapshot] = None) -> None:
+        """Decide and perform an action immediately.
 
-    def get_path_to(self, dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
+        `snapshot` should be the snapshot of the current turn, a new one is taken if it's None.
+        """
+        action = self.decide(snapshot if snapshot is not None else TurnSnapshot(self.engine))
+        if action is not None:
+            action.perform()
+
+    def decide(self, snapshot: TurnSnapshot) -> Optional[Action]:
+        """Return the action this AI intends to take this turn.
+
+        This may be called from a worker thread.  The map and other entities must only be read through `snapshot`,
+        the only state which may be modified is the state of this AI component, such as its path.
+        Returning None will call `perform` once it is this actors turn instead.
+        """
+        return None
+
+    def can_see_player(self, snapshot: TurnSnapshot) -> bool:
+        """Return True if this AI could see the player at the start of the turn."""
+        if not self.sight_radius:
+            return bool(snapshot.visible[self.entity.x, self.entity.y])  # The players FOV is symmetric.
+        viewer = self.entity.x, self.entity.y, self.sight_radius
+        return snapshot.perception.can_see(viewer, *snapshot.player_xy)
+
+    def get_path_to(
+        self, dest_x: int, dest_y: int, cost_func: Optional[game.pathfinding.CostFunc] = None
+    ) -> List[Tuple[int, int]]:
         """Compute and return a path to the target position.
 
+        `cost_func` returns the movement cost for a window of the map, by default the current cost is used.
+
         If there is no valid path then returns an empty list.
         """
-        # Copy the walkable array.
-        cost: NDArray[np.int8] = np.array(self.entity.gamemap.tiles, dtype=np.int8)
-
-        for entity in self.entity.gamemap.entities:
-            # Check that an enitiy blocks movement and the cost isn't zero (blocking.)
-            if entity.blocks_movement and cost[entity.x, entity.y]:
-                # Add to the cost of a blocked position.
-                # A lower number means more enemies will crowd behind each other in
-                # hallways.  A higher number means enemies will take longer paths in
-                # order to surround the player.
-                cost[entity.x, entity.y] += 10
+        gamemap = self.entity.gamemap
+        if cost_func is None:
+            cost_func = functools.partial(get_path_cost, gamemap)
+        if gamemap.width * gamemap.height >= game.constants.hierarchical_path_area:
+            # Large maps search the precomputed cluster graph instead of the whole map.
+            return gamemap.path_graph.path_to((self.entity.x, self.entity.y), (dest_x, dest_y), cost_func)
+
+        cost = cost_func((slice(0, gamemap.width), slice(0, gamemap.height)))
 
         # Create a graph from the cost array and pass that graph to a new pathfinder.
         graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
@@ -48,7 +138,7 @@ def get_path_to(self, dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
 
 
 class Idle(BaseAI):
-    def perform(self) -> None:
+    def perform(self, snapshot: Optional[TurnSnapshot] = None) -> None:
         pass
 
 
@@ -57,17 +147,17 @@ def __init__(self, entity: game.entity.Actor):
         super().__init__(entity)
         self.path: List[Tuple[int, int]] = []
 
-    def perform(self) -> None:
-        target = self.engine.player
-        dx = target.x - self.entity.x
-        dy = target.y - self.entity.y
+    def decide(self, snapshot: TurnSnapshot) -> Optional[Action]:
+        target_x, target_y = snapshot.player_xy
+        dx = target_x - self.entity.x
+        dy = target_y - self.entity.y
         distance = max(abs(dx), abs(dy))  # Chebyshev distance.
 
-        if self.engine.game_map.visible[self.entity.x, self.entity.y]:
+        if self.can_see_player(snapshot):
             if distance <= 1:
-                return game.actions.Melee(self.entity, dx, dy).perform()
+                return game.actions.Melee(self.entity, dx, dy)
 
-            self.path = self.get_path_to(target.x, target.y)
+            self.path = self.get_path_to(target_x, target_y, snapshot.path_cost)
 
         if self.path:
             dest_x, dest_y = self.path.pop(0)
@@ -75,9 +165,9 @@ def perform(self) -> None:
                 self.entity,
                 dest_x - self.entity.x,
                 dest_y - self.entity.y,
-            ).perform()
+            )
 
-        return game.actions.Wait(self.entity).perform()
+        return game.actions.Wait(self.entity)
 
 
 class ConfusedEnemy(BaseAI):
@@ -92,33 +182,39 @@ def __init__(self, entity: game.entity.Actor, previous_ai: BaseAI, turns_remaini
         self.previous_ai = previous_ai
         self.turns_remaining = turns_remaining
 
-    def perform(self) -> None:
+    def perform(self, snapshot: Optional[TurnSnapshot] = None) -> None:
         # Revert the AI back to the original state if the effect has run its course.
         if self.turns_remaining <= 0:
             self.engine.message_log.add_message(f"The {self.entity.name} is no longer confused.")
             assert self.parent
             self.parent[BaseAI] = self.previous_ai
         else:
-            # Pick a random direction
-            direction_x, direction_y = random.choice(
-                [
-                    (-1, -1),  # Northwest
-                    (0, -1),  # North
-                    (1, -1),  # Northeast
-                    (-1, 0),  # West
-                    (1, 0),  # East
-                    (-1, 1),  # Southwest
-                    (0, 1),  # South
-                    (1, 1),  # Southeast
-                ]
-            )
+            super().perform(snapshot)
 
-            self.turns_remaining -= 1
-
-            # The actor will either try to move or attack in the chosen random direction.
-            # Its possible the actor will just bump into the wall, wasting a turn.
-            return game.actions.Bump(
-                self.entity,
-                direction_x,
-                direction_y,
-            ).perform()
+    def decide(self, snapshot: TurnSnapshot) -> Optional[Action]:
+        if self.turns_remaining <= 0:
+            return None  # Reverting the AI is handled by `perform`.
+
+        # Pick a random direction
+        direction_x, direction_y = snapshot.rng_for(self.entity).choice(
+            [
+                (-1, -1),  # Northwest
+                (0, -1),  # North
+                (1, -1),  # Northeast
+                (-1, 0),  # West
+                (1, 0),  # East
+                (-1, 1),  # Southwest
+                (0, 1),  # South
+                (1, 1),  # Southeast
+            ]
+        )
+
+        self.turns_remaining -= 1
+
+        # The actor will either try to move or attack in the chosen random direction.
+        # Its possible the actor will just bump into the wall, wasting a turn.
+        return game.actions.Bump(
+            self.entity,
+            direction_x,
+            direction_y,
+        )
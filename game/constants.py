@@ -15,6 +15,33 @@
 
 ui_width = 30
 
+# The area of the screen the map is drawn on, maps larger than this scroll with the player.
+map_view_width = screen_width - ui_width
+map_view_height = screen_height
+
+message_log_size = 1000  # Number of recent messages kept in the message log.
+message_history_dir = "message_history"  # The full message history of each game is kept here.
+
 room_max_size = 10
 room_min_size = 6
 max_rooms = 30
+
+fov_radius = 0  # Sight radius of the player, 0 is unlimited.  FOV cost only depends on this when it's set.
+
+smoke_opaque = 100  # Tiles with at least this much smoke block vision.
+
+hierarchical_path_area = 128 * 128  # Maps of at least this many tiles use hierarchical pathfinding.
+tick_rate = 4  # Simulation ticks per second in real-time mode.
+max_fps = 30  # Frames rendered per second in real-time mode, frames are dropped before ticks are.
+max_catchup_ticks = 20  # Missed ticks beyond this are skipped instead of simulated.
+
+wfc_cache_dir = "wfc_cache"  # Generated dungeon layouts are cached here.
+wfc_cache_max_bytes = 64 * 1024 * 1024  # Older layouts are removed from the cache past this size.
+
+open_world = False  # Use an endless map generated in chunks around the player instead of fixed size floors.
+chunk_size = 32  # Width and height of each chunk of the open world.
+chunk_span = 3  # Width and height in chunks of the loaded area of the open world, must be odd.
+
+pregenerate_floors = True  # Generate the next floor in a background process when a floor is entered.
+
+ai_workers = 0  # Number of threads used to make AI decisions, 0 or 1 decides on the main thread.
@@ -1,22 +1,42 @@
 from __future__ import annotations
 
+import concurrent.futures
 import logging
 import lzma
 import pickle
 import random
+from typing import List, Optional, Tuple
 
 import tcod
 
+import g
+import game.constants
 import game.entity
 import game.exceptions
 import game.game_map
 import game.message_log
+import game.profiler
 import game.simulation
-from game.components.ai import BaseAI
+from game.actions import Action
+from game.components.ai import BaseAI, TurnSnapshot
 from game.node import Node
 
 logger = logging.getLogger(__name__)
 
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_workers = 0
+
+
+def _get_executor(workers: int) -> concurrent.futures.ThreadPoolExecutor:
+    """Return a shared thread pool with the given number of workers."""
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="ai")
+        _executor_workers = workers
+    return _executor
+
 
 class Engine(Node):
     game_map: game.game_map.GameMap
@@ -29,31 +49,124 @@ def __init__(self) -> None:
         super().__init__()
         self.message_log = game.message_log.MessageLog()
 
+    @property
+    def camera(self) -> Tuple[int, int]:
+        """The map position shown at the top-left of the map view.  The camera follows the player."""
+        view_width, view_height = game.constants.map_view_width, game.constants.map_view_height
+        return (
+            max(0, min(self.player.x - view_width // 2, self.game_map.width - view_width)),
+            max(0, min(self.player.y - view_height // 2, self.game_map.height - view_height)),
+        )
+
+    def screen_to_map(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """Convert a screen tile to a map position, returns None if the tile is not over the map."""
+        if not (0 <= x < game.constants.map_view_width and 0 <= y < game.constants.map_view_height):
+            return None
+        cam_x, cam_y = self.camera
+        x, y = x + cam_x, y + cam_y
+        if not self.game_map.in_bounds(x, y):
+            return None
+        return x, y
+
+    def tick(self) -> None:
+        """Advance the real-time simulation of the map by one tick."""
+        with game.profiler.section("fire_step"):
+            game.simulation.fire_step(self.game_map)
+        self.update_fov()  # Smoke may have changed what is visible.
+
     def handle_enemy_turns(self) -> None:
-        game.simulation.fire_step(self.game_map)
+        if not g.realtime:  # Otherwise the simulation advances on its own tick.
+            with game.profiler.section("fire_step"):
+                game.simulation.fire_step(self.game_map)
         logger.info("Enemy turn.")
-        for entity in self.game_map.entities:
-            if entity is self.player:
-                continue
-            if not isinstance(entity, game.entity.Actor):
-                continue
-            ai = entity.try_get(BaseAI)
-            if ai:
-                try:
-                    ai.perform()
-                except game.exceptions.Impossible:
-                    pass  # Ignore impossible action exceptions from AI.
+        # Actors take turns in a fixed order so that results don't depend on how decisions were scheduled.
+        actors = sorted(
+            (
+                actor
+                for actor in self.game_map.get_children(game.entity.Actor)
+                if actor is not self.player and actor.is_alive
+            ),
+            key=lambda actor: (actor.y, actor.x),
+        )
+        with game.profiler.section("ai.snapshot"):
+            snapshot = TurnSnapshot(self)
+        decisions = self.decide_enemy_actions(actors, snapshot)
+
+        for actor, action in zip(actors, decisions):
+            ai = actor.try_get(BaseAI)
+            if ai is None:
+                continue  # Died earlier this turn.
+            try:
+                with game.profiler.section("ai.resolve"):
+                    if action is None:
+                        ai.perform(snapshot)
+                    else:
+                        action.perform()  # Conflicts with earlier actors in this turn are Impossible and skipped.
+            except game.exceptions.Impossible:
+                pass  # Ignore impossible action exceptions from AI.
+
+    @staticmethod
+    def decide_enemy_actions(actors: List[game.entity.Actor], snapshot: TurnSnapshot) -> List[Optional[Action]]:
+        """Return the action each actor intends to take, in the same order as `actors`.
+
+        Decisions only read from `snapshot`, so they are split between `constants.ai_workers` threads if set.
+        """
+
+        def decide(actor: game.entity.Actor) -> Optional[Action]:
+            ai = actor[BaseAI]
+            with game.profiler.section("ai", type(ai).__name__):
+                return ai.decide(snapshot)
+
+        workers = min(game.constants.ai_workers, len(actors))
+        if workers <= 1:
+            return [decide(actor) for actor in actors]
+
+        def decide_batch(batch: List[game.entity.Actor]) -> List[Optional[Action]]:
+            return [decide(actor) for actor in batch]
+
+        batches = [actors[i::workers] for i in range(workers)]
+        results = list(_get_executor(workers).map(decide_batch, batches))
+        # Interleave the batch results back into the original order.
+        decisions: List[Optional[Action]] = [None] * len(actors)
+        for i, batch_result in enumerate(results):
+            decisions[i::workers] = batch_result
+        return decisions
 
     def update_fov(self) -> None:
-        """Recompute the visible area based on the players point of view."""
-        self.game_map.visible[:] = tcod.map.compute_fov(
-            self.game_map.tiles,
-            (self.player.x, self.player.y),
-            radius=0,
+        """Recompute the visible area based on the players point of view.
+
+        Only the window within `constants.fov_radius` of the player is computed.
+        Does nothing if neither the player position nor the opacity of the map has changed since the last call.
+        """
+        with game.profiler.section("update_fov"):
+            self._update_fov()
+
+    def _update_fov(self) -> None:
+        gamemap = self.game_map
+        gamemap.follow(self.player.x, self.player.y)
+        origin = x, y = self.player.x, self.player.y
+        if gamemap.fov_origin == origin and gamemap.fov_opacity_version == gamemap.opacity_version:
+            return
+        gamemap.fov_origin = origin
+        gamemap.fov_opacity_version = gamemap.opacity_version
+
+        radius = game.constants.fov_radius
+        if radius:
+            window = slice(max(0, x - radius), x + radius + 1), slice(max(0, y - radius), y + radius + 1)
+        else:
+            window = slice(0, gamemap.width), slice(0, gamemap.height)
+        gamemap.visible[gamemap.fov_window] = False  # Clear only the area which was visible before.
+        gamemap.redraw(gamemap.fov_window)
+        gamemap.redraw(window)
+        gamemap.fov_window = window
+        gamemap.visible[window] = tcod.map.compute_fov(
+            gamemap.transparency[window],
+            (x - window[0].start, y - window[1].start),
+            radius=radius,
             algorithm=tcod.FOV_SYMMETRIC_SHADOWCAST,
         )
         # If a tile is currently "visible" it will also be marked as "explored".
-        self.game_map.explored |= self.game_map.visible
+        gamemap.explored[window] |= gamemap.visible[window]
 
     def save_as(self, filename: str) -> None:
         """Save this Engine instance as a compressed file."""
@@ -1,17 +1,42 @@
 from __future__ import annotations
 
-from typing import Any, Iterator, Optional
+import concurrent.futures
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Tuple
 
 import numpy as np
 from numpy.typing import NDArray
 
+import game.constants
 import game.engine
 import game.entity
+import game.pathfinding
+import game.perception
+import game.tiles
 from game.constants import SHROUD
 from game.node import Node
 
+if TYPE_CHECKING:
+    import game.rendering
+
+logger = logging.getLogger(__name__)
+
+_floor_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+
+def _get_floor_executor() -> concurrent.futures.ProcessPoolExecutor:
+    """Return the shared process pool used to generate floors in the background."""
+    global _floor_executor
+    if _floor_executor is None:
+        _floor_executor = concurrent.futures.ProcessPoolExecutor(1)
+    return _floor_executor
+
 
 class GameMap(Node):
+    _path_graph: Optional[game.pathfinding.ClusterGraph] = None  # Lazily built, not saved.
+    _perception: Optional[game.perception.Perception] = None  # Lazily built, not saved.
+    render_cache: Optional[game.rendering.MapRenderCache] = None  # Managed by game.rendering, not saved.
+
     def __init__(self, engine: game.engine.Engine, width: int, height: int):
         super().__init__()
         self.engine = engine
@@ -21,6 +46,10 @@ def __init__(self, engine: game.engine.Engine, width: int, height: int):
         self.fuel: NDArray[np.int32] = np.zeros((width, height), dtype=np.int32, order="F")
         self.heat: NDArray[np.int32] = np.zeros((width, height), dtype=np.int32, order="F")
         self.smoke: NDArray[np.int32] = np.zeros((width, height), dtype=np.int32, order="F")
+        # Tiles which don't block vision, derived from tiles and smoke by `tiles_changed` and `smoke_changed`.
+        self.transparency: NDArray[np.bool_] = np.zeros((width, height), dtype=bool, order="F")
+        # Extra movement cost of hazardous tiles, updated once per turn by game.simulation.update_hazard.
+        self.hazard: NDArray[np.int32] = np.zeros((width, height), dtype=np.int32, order="F")
 
         self.memory: NDArray[Any] = np.full((width, height), fill_value=SHROUD, order="F")
 
@@ -29,8 +58,34 @@ def __init__(self, engine: game.engine.Engine, width: int, height: int):
         self.visible = np.full((width, height), fill_value=False, order="F")  # Tiles the player can currently see
         self.explored = np.full((width, height), fill_value=False, order="F")  # Tiles the player has seen before
 
+        # Version counters, these are incremented whenever their layer is modified.
+        self.tiles_version = 0
+        self.smoke_version = 0
+        self.opacity_version = 0
+
+        # The inputs of the last FOV computation, used to skip redundant updates.
+        self.fov_origin: Optional[Tuple[int, int]] = None
+        self.fov_opacity_version = -1
+        self.fov_window: Tuple[slice, slice] = (slice(0, 0), slice(0, 0))  # The area `visible` can be True in.
+
         self.downstairs_location = (0, 0)
 
+    def __getstate__(self) -> Dict[str, Any]:
+        """Skip cached data when pickling, it will be rebuilt as needed."""
+        state = self.__dict__.copy()
+        state.pop("_path_graph", None)
+        state.pop("_perception", None)
+        state.pop("render_cache", None)
+        return state
+
+    def attach(self, engine: game.engine.Engine) -> None:
+        """Move this map to `engine`, used for maps which were generated in another process."""
+        self.engine = engine
+        self.parent = engine
+
+    def follow(self, x: int, y: int) -> None:
+        """Called with the position of the player whenever it may have changed, used by maps which stream chunks."""
+
     @property
     def entities(self) -> Iterator[game.entity.Entity]:
         yield from self.get_children(game.entity.Entity)
@@ -39,6 +94,52 @@ def entities(self) -> Iterator[game.entity.Entity]:
     def gamemap(self) -> GameMap:
         return self
 
+    @property
+    def path_graph(self) -> game.pathfinding.ClusterGraph:
+        """The hierarchical pathfinding graph of this map."""
+        if self._path_graph is None:
+            self._path_graph = game.pathfinding.ClusterGraph(self)
+        return self._path_graph
+
+    @property
+    def perception(self) -> game.perception.Perception:
+        """The NPC field of view cache of this map."""
+        if self._perception is None:
+            self._perception = game.perception.Perception(self)
+        return self._perception
+
+    def redraw(self, where: Any) -> None:
+        """Mark the tiles at `where` as needing to be redrawn by the renderer."""
+        if self.render_cache is not None:
+            self.render_cache.mark(where)
+
+    def tiles_changed(self, where: Any) -> None:
+        """Must be called after `tiles` are modified, `where` is the index of the modified tiles."""
+        self.tiles_version += 1
+        self.redraw(where)
+        if self._path_graph is not None:
+            self._path_graph.invalidate(where)
+        self._update_transparency(where)
+
+    def fire_changed(self, where: Any) -> None:
+        """Must be called after tiles catch fire or are extinguished, `where` is the index of the changed tiles."""
+        self.redraw(where)
+
+    def smoke_changed(self, where: Any) -> None:
+        """Must be called after `smoke` is modified, `where` is the index of the modified tiles."""
+        self.smoke_version += 1
+        self._update_transparency(where)
+
+    def _update_transparency(self, where: Any) -> None:
+        """Refresh the transparency of the tiles at `where`."""
+        transparency = game.tiles.tile_transparent[self.tiles[where]] & (
+            self.smoke[where] < game.constants.smoke_opaque
+        )
+        if np.array_equal(transparency, self.transparency[where]):
+            return
+        self.transparency[where] = transparency
+        self.opacity_version += 1
+
     def get_blocking_entity_at(self, x: int, y: int) -> Optional[game.entity.Entity]:
         """Returns an entity that blocks the position at x,y if one exists, otherwise returns None."""
         for entity in self.entities:
@@ -64,6 +165,9 @@ class GameWorld:
     Holds the settings for the GameMap, and generates new maps when moving down the stairs.
     """
 
+    _next_floor: Optional[concurrent.futures.Future[GameMap]] = None  # The next floor being generated, not saved.
+    pregenerate_floors = True  # The default for saves which predate the option.
+
     def __init__(
         self,
         *,
@@ -73,9 +177,13 @@ def __init__(
         max_rooms: int,
         room_min_size: int,
         room_max_size: int,
+        seed: int,
         current_floor: int = 0,
+        pregenerate_floors: bool = True,
     ):
         self.engine = engine
+        self.seed = seed  # Every floor is generated from this seed and its floor number.
+        self.pregenerate_floors = pregenerate_floors  # Generate the next floor in a background process.
 
         self.map_width = map_width
         self.map_height = map_height
@@ -87,16 +195,78 @@ def __init__(
 
         self.current_floor = current_floor
 
+    def __getstate__(self) -> Dict[str, Any]:
+        """A floor being generated is not saved, it will be generated again from its seed."""
+        state = self.__dict__.copy()
+        state.pop("_next_floor", None)
+        return state
+
+    def _take_next_floor(self) -> Optional[GameMap]:
+        """Return the next floor if it was generated in the background, otherwise None."""
+        future = self._next_floor
+        self._next_floor = None
+        if future is None or future.cancel():
+            return None  # Generation has not started, it's faster to do it here.
+        try:
+            return future.result()
+        except Exception:
+            logger.exception("Failed to generate the next floor in the background.")
+            return None
+
+    def pregenerate_next_floor(self) -> None:
+        """Start generating the next floor in a background process."""
+        import game.procgen
+
+        try:
+            self._next_floor = _get_floor_executor().submit(
+                game.procgen.generate_dungeon,
+                max_rooms=self.max_rooms,
+                room_min_size=self.room_min_size,
+                room_max_size=self.room_max_size,
+                map_width=self.map_width,
+                map_height=self.map_height,
+                seed=self.seed,
+                floor=self.current_floor + 1,
+            )
+        except (OSError, RuntimeError):  # Processes are not available, floors will be generated when needed.
+            logger.exception("Could not start generating the next floor.")
+
     def generate_floor(self) -> None:
+        """Move to a new floor, using the floor generated in the background if it's available.
+
+        The next floor then starts generating in the background if `pregenerate_floors` is set.
+        If `constants.open_world` is set then the floor is an endless chunked map instead.
+        """
+        import game.chunks
         import game.procgen
 
         self.current_floor += 1
 
-        self.engine.game_map = game.procgen.generate_dungeon(
-            max_rooms=self.max_rooms,
-            room_min_size=self.room_min_size,
-            room_max_size=self.room_max_size,
-            map_width=self.map_width,
-            map_height=self.map_height,
-            engine=self.engine,
-        )
+        if game.constants.open_world:
+            self.engine.game_map = game.chunks.ChunkedGameMap(
+                self.engine,
+                seed=self.seed,
+                floor=self.current_floor,
+                chunk_size=game.constants.chunk_size,
+                span=game.constants.chunk_span,
+            )
+            return
+
+        game_map = self._take_next_floor()
+        if game_map is not None:
+            game_map.attach(self.engine)
+        else:
+            game_map = game.procgen.generate_dungeon(
+                max_rooms=self.max_rooms,
+                room_min_size=self.room_min_size,
+                room_max_size=self.room_max_size,
+                map_width=self.map_width,
+                map_height=self.map_height,
+                seed=self.seed,
+                floor=self.current_floor,
+                engine=self.engine,
+            )
+        self.engine.game_map = game_map
+
+        if self.pregenerate_floors:
+            self.pregenerate_next_floor()
@@ -0,0 +1,140 @@
+"""Run the game without a window, for benchmarks, bots and golden-image comparisons.
+
+Frames are rendered to an off-screen console and returned as NumPy arrays.
+
+Can be run as a module to benchmark rendering over a number of turns:
+
+    python -m game.headless --turns 100 --seed 1
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import tcod
+from numpy.typing import NDArray
+
+import game.engine  # isort: skip  # Imported first to avoid a circular import.
+import game.actions
+import game.input_handlers
+import game.rendering
+import game.setup_game
+import game.typing
+from game.constants import screen_height, screen_width
+
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+
+class Headless:
+    """Drives an event handler with scripted events or actions and renders it off-screen.
+
+    If `render` is False then frames are only rendered when `frame` is called.
+    """
+
+    def __init__(self, handler: game.typing.EventHandler, *, render: bool = True):
+        self.handler = handler
+        self.render = render
+        self.console = tcod.Console(screen_width, screen_height, order="F")
+
+    @classmethod
+    def new_game(cls, seed: Optional[int] = None, *, render: bool = True) -> Headless:
+        """Start a new game, the dungeon and engine RNG are seeded with `seed` if it is given.
+
+        The message history is kept in memory so that the history files of real games are left alone.  Floors are not
+        generated in a background process, which would compete with what is being measured.
+        """
+        engine = game.setup_game.new_game(seed, history=False, pregenerate_floors=False)
+        return cls(game.input_handlers.MainGameEventHandler(engine), render=render)
+
+    @property
+    def engine(self) -> game.engine.Engine:
+        """The engine of the active handler."""
+        assert isinstance(self.handler, game.input_handlers.EventHandler), f"{self.handler!r} has no engine."
+        return self.handler.engine
+
+    def frame(self) -> NDArray[Any]:
+        """Render the active handler and return a copy of the console tiles."""
+        self.console.clear()
+        self.handler.on_render(self.console)
+        rgb: NDArray[Any] = self.console.rgb.copy()
+        return rgb
+
+    def send(self, events: Iterable[tcod.event.Event]) -> None:
+        """Dispatch `events` to the active handler, then render once as the main loop does."""
+        for event in events:
+            self.handler = self.handler.handle_events(event)
+        if self.render:
+            self.frame()
+
+    def key(self, sym: tcod.event.KeySym, mod: tcod.event.Modifier = tcod.event.Modifier.NONE) -> None:
+        """Press the key `sym`."""
+        self.send([tcod.event.KeyDown(scancode=tcod.event.Scancode.UNKNOWN, sym=sym, mod=mod)])
+
+    def mouse_move(self, x: int, y: int) -> None:
+        """Move the mouse over the console tile `x`, `y`."""
+        self.send([tcod.event.MouseMotion(tile=tcod.event.Point(x, y))])
+
+    def click(self, x: int, y: int, button: tcod.event.MouseButton = tcod.event.MouseButton.LEFT) -> None:
+        """Click on the console tile `x`, `y`."""
+        self.send([tcod.event.MouseButtonDown(tile=tcod.event.Point(x, y), button=button)])
+
+    def act(self, action: game.actions.Action) -> None:
+        """Perform an action for the player as if it came from input."""
+        handler = self.handler
+        assert isinstance(handler, game.input_handlers.EventHandler), f"{handler!r} can not handle actions."
+        self.handler = handler.submit_action(action)
+        if self.render:
+            self.frame()
+
+    def time_render(self, frames: int, *, full: bool = False) -> Dict[str, float]:
+        """Return the mean seconds spent in `render_map` and `render_ui` over a number of frames.
+
+        If `full` is True then the map render cache is discarded before each frame.
+        """
+        engine = self.engine
+        timings: Dict[str, List[float]] = {"render_map": [], "render_ui": []}
+        for _ in range(frames):
+            if full:
+                engine.game_map.render_cache = None
+            self.console.clear()
+            start = time.perf_counter()
+            game.rendering.render_map(self.console, engine.game_map, engine.camera)
+            timings["render_map"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            game.rendering.render_ui(self.console, engine)
+            timings["render_ui"].append(time.perf_counter() - start)
+        return {name: float(np.mean(samples)) for name, samples in timings.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Play random turns without a window and report timings as JSON.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--frames", type=int, default=100, help="Frames rendered for each render benchmark.")
+    args = parser.parse_args()
+
+    headless = Headless.new_game(args.seed, render=False)
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    for _ in range(args.turns):
+        if not headless.engine.player.is_alive:
+            break
+        dx, dy = rng.choice(DIRECTIONS)
+        headless.act(game.actions.Bump(headless.engine.player, dx, dy))
+    turns_time = time.perf_counter() - start
+    results = {
+        "seed": args.seed,
+        "turns": args.turns,
+        "turn_mean": turns_time / max(1, args.turns),
+        "render": headless.time_render(args.frames),
+        "render_full": headless.time_render(args.frames, full=True),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
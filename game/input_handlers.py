@@ -1,17 +1,21 @@
 from __future__ import annotations
 
 import os
-from typing import Callable, Optional, Tuple
+from typing import Callable, Iterable, List, Optional, Tuple
 
 import numpy as np
 import tcod
+from numpy.typing import NDArray
 
 import g
 import game.actions
 import game.color
+import game.constants
 import game.engine
 import game.entity
 import game.exceptions
+import game.message_log
+import game.profiler
 import game.rendering
 import game.typing
 from game.typing import ActionOrHandler
@@ -59,6 +63,30 @@
 }
 
 
+def coalesce_events(events: Iterable[tcod.event.Event]) -> List[tcod.event.Event]:
+    """Return a batch of events with the redundant events removed.
+
+    Only the last mouse motion of the batch is kept and text input, which no handler uses, is dropped.
+    A run of repeats of a held key is reduced to its last repeat.
+    """
+    result: List[Optional[tcod.event.Event]] = []
+    last_motion: Optional[int] = None
+    for event in events:
+        if isinstance(event, tcod.event.TextInput):
+            continue
+        if isinstance(event, tcod.event.MouseMotion):
+            if last_motion is not None:
+                result[last_motion] = None
+            last_motion = len(result)
+        elif isinstance(event, tcod.event.KeyDown) and event.repeat and result:
+            previous = result[-1]
+            if isinstance(previous, tcod.event.KeyDown) and previous.repeat and previous.sym == event.sym:
+                result[-1] = event
+                continue
+        result.append(event)
+    return [event for event in result if event is not None]
+
+
 class BaseEventHandler(tcod.event.EventDispatch[ActionOrHandler]):
     def handle_events(self, event: tcod.event.Event) -> BaseEventHandler:
         """Handle an event and return the next active event handler."""
@@ -71,6 +99,10 @@ def handle_events(self, event: tcod.event.Event) -> BaseEventHandler:
     def on_render(self, console: tcod.Console) -> None:
         raise NotImplementedError()
 
+    def on_tick(self) -> BaseEventHandler:
+        """Advance the real-time simulation by one tick and return the next active event handler."""
+        return self
+
     def ev_quit(self, event: tcod.event.Quit) -> Optional[ActionOrHandler]:
         raise SystemExit()
 
@@ -112,7 +144,13 @@ def handle_events(self, event: tcod.event.Event) -> BaseEventHandler:
         action_or_state = self.dispatch(event)
         if isinstance(action_or_state, EventHandler):
             return action_or_state
-        if isinstance(action_or_state, game.actions.Action) and self.handle_action(action_or_state):
+        if isinstance(action_or_state, game.actions.Action):
+            return self.submit_action(action_or_state)
+        return self
+
+    def submit_action(self, action: game.actions.Action) -> BaseEventHandler:
+        """Perform a player action, then return the next active event handler."""
+        if self.handle_action(action):
             # A valid action was performed.
             if not self.engine.player.is_alive:
                 # The player was killed sometime during or after the action.
@@ -125,30 +163,39 @@ def handle_events(self, event: tcod.event.Event) -> BaseEventHandler:
     def handle_action(self, action: game.actions.Action) -> BaseEventHandler:
         return self
 
+    def on_tick(self) -> BaseEventHandler:
+        """Advance the simulation of the map, the player may die from fire."""
+        self.engine.tick()
+        if not self.engine.player.is_alive and not isinstance(self, GameOverEventHandler):
+            return GameOverEventHandler(self.engine)
+        return self
+
     def ev_quit(self, event: tcod.event.Quit) -> Optional[ActionOrHandler]:
         raise SystemExit()
 
     def on_render(self, console: tcod.Console) -> None:
-        game.rendering.render_map(console, self.engine.game_map)
-        game.rendering.render_ui(console, self.engine)
+        with game.profiler.section("render_map"):
+            game.rendering.render_map(console, self.engine.game_map, self.engine.camera)
+        with game.profiler.section("render_ui"):
+            game.rendering.render_ui(console, self.engine)
 
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
-        if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
-            g.mouse_pos = event.tile.x, event.tile.y
-        else:
-            g.mouse_pos = None
+        g.mouse_pos = self.engine.screen_to_map(event.tile.x, event.tile.y)
+        if g.mouse_pos:
+            self.engine.mouse_location = g.mouse_pos
 
 
 class MainGameEventHandler(EventHandler):
     def handle_action(self, action: game.actions.Action) -> EventHandler:
         """Handle actions returned from event methods."""
         try:
-            action.perform()
+            with game.profiler.section("action"):
+                action.perform()
         except game.exceptions.Impossible as exc:
             self.engine.message_log.add_message(exc.args[0], game.color.impossible)
             return self  # Skip enemy turn on exceptions.
-        self.engine.handle_enemy_turns()
+        with game.profiler.section("enemy_turns"):
+            self.engine.handle_enemy_turns()
         self.engine.update_fov()
         if not self.engine.player.is_alive:
             return GameOverEventHandler(self.engine)
@@ -183,6 +230,11 @@ def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
             return LookHandler(self.engine)
         elif __debug__ and key == tcod.event.KeySym.F8:
             g.fullbright = not g.fullbright
+        elif key == tcod.event.KeySym.F9:
+            game.profiler.toggle()
+        elif key == tcod.event.KeySym.F10 and game.profiler.enabled:
+            game.profiler.export("profile.jsonl")
+            self.engine.message_log.add_message("Profile appended to profile.jsonl.")
 
         return None
 
@@ -224,7 +276,7 @@ class CharacterScreenEventHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)
 
-        if self.engine.player.x <= 30:
+        if self.engine.player.x - self.engine.camera[0] <= 30:
             x = 40
         else:
             x = 0
@@ -262,7 +314,7 @@ class LevelUpEventHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)
 
-        if self.engine.player.x <= 30:
+        if self.engine.player.x - self.engine.camera[0] <= 30:
             x = 40
         else:
             x = 0
@@ -344,7 +396,7 @@ def on_render(self, console: tcod.Console) -> None:
         if height <= 3:
             height = 3
 
-        if self.engine.player.x <= 30:
+        if self.engine.player.x - self.engine.camera[0] <= 30:
             x = 40
         else:
             x = 0
@@ -435,9 +487,10 @@ def __init__(self, engine: game.engine.Engine):
     def on_render(self, console: tcod.Console) -> None:
         """Highlight the tile under the cursor."""
         super().on_render(console)
+        cam_x, cam_y = self.engine.camera
         x, y = self.engine.mouse_location
-        console.tiles_rgb["bg"][x, y] = game.color.white
-        console.tiles_rgb["fg"][x, y] = game.color.black
+        console.tiles_rgb["bg"][x - cam_x, y - cam_y] = game.color.white
+        console.tiles_rgb["fg"][x - cam_x, y - cam_y] = game.color.black
 
     def on_index_selected(self, x: int, y: int) -> Optional[ActionOrHandler]:
         """Called when an index is selected."""
@@ -459,9 +512,10 @@ def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
             dx, dy = MOVE_KEYS[key]
             x += dx * modifier
             y += dy * modifier
-            # Clamp the cursor index to the map size.
-            x = max(0, min(x, self.engine.game_map.width - 1))
-            y = max(0, min(y, self.engine.game_map.height - 1))
+            # Clamp the cursor index to the part of the map in view.
+            cam_x, cam_y = self.engine.camera
+            x = max(cam_x, min(x, cam_x + game.constants.map_view_width - 1, self.engine.game_map.width - 1))
+            y = max(cam_y, min(y, cam_y + game.constants.map_view_height - 1, self.engine.game_map.height - 1))
             self.engine.mouse_location = x, y
             return None
         elif key in CONFIRM_KEYS:
@@ -470,9 +524,10 @@ def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
 
     def ev_mousebuttondown(self, event: tcod.event.MouseButtonDown) -> Optional[ActionOrHandler]:
         """Left click confirms a selection."""
-        if self.engine.game_map.in_bounds(*event.tile):
+        map_xy = self.engine.screen_to_map(*event.tile)
+        if map_xy:
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(*map_xy)
         return super().ev_mousebuttondown(event)
 
 
@@ -511,29 +566,52 @@ def __init__(
 
         self.radius = radius
         self.callback = callback
+        # The last AOE as (cache_key, window_origin, aoe_tiles), where `aoe_tiles` covers a window around the cursor.
+        self.aoe: Optional[Tuple[Tuple[object, ...], Tuple[int, int], NDArray[np.bool_]]] = None
 
-    def on_render(self, console: tcod.Console) -> None:
-        """Highlight the tile under the cursor."""
-        super().on_render(console)
-
-        aoe_tiles = np.full((self.engine.game_map.width, self.engine.game_map.height), fill_value=False, order="F")
+    def get_aoe(self) -> Tuple[Tuple[int, int], NDArray[np.bool_]]:
+        """Return the area of effect at the cursor as (window_origin, aoe_tiles).
 
+        Only the window within the radius of the cursor is computed.  The result is cached until the cursor moves or
+        the visible area changes.
+        """
+        game_map = self.engine.game_map
         x, y = self.engine.mouse_location
+        key = (x, y, self.radius, game_map.opacity_version, game_map.fov_origin)
+        if self.aoe is not None and self.aoe[0] == key:
+            return self.aoe[1:]
+
+        x0, y0 = max(0, x - self.radius), max(0, y - self.radius)
+        window = np.s_[x0 : x + self.radius + 1, y0 : y + self.radius + 1]
+        aoe_tiles: NDArray[np.bool_] = tcod.map.compute_fov(
+            game_map.transparency[window],
+            (x - x0, y - y0),
+            radius=self.radius,
+            light_walls=False,
+            algorithm=tcod.FOV_BASIC,
+        )
+        aoe_tiles &= game_map.visible[window]
+        aoe_tiles[x - x0, y - y0] = False
+        self.aoe = key, (x0, y0), aoe_tiles
+        return self.aoe[1:]
 
-        # Calculate and draw the aoe if the target is visible.
-        if self.engine.game_map.visible[x, y]:
-            aoe_tiles[:] = tcod.map.compute_fov(
-                self.engine.game_map.tiles,
-                self.engine.mouse_location,
-                radius=self.radius,
-                light_walls=False,
-                algorithm=tcod.FOV_BASIC,
-            )
-
-            aoe_tiles &= self.engine.game_map.visible
+    def on_render(self, console: tcod.Console) -> None:
+        """Highlight the tile under the cursor."""
+        super().on_render(console)
 
-            aoe_tiles[x, y] = False
-            console.tiles_rgb["bg"][: aoe_tiles.shape[0], : aoe_tiles.shape[1]][aoe_tiles] = game.color.red
+        # Draw the aoe if the target is visible.
+        if not self.engine.game_map.visible[self.engine.mouse_location]:
+            return
+        (x0, y0), aoe_tiles = self.get_aoe()
+        cam_x, cam_y = self.engine.camera
+        # Clip the aoe window to the map view.
+        left, top = max(x0, cam_x), max(y0, cam_y)
+        right = min(x0 + aoe_tiles.shape[0], cam_x + game.constants.map_view_width)
+        bottom = min(y0 + aoe_tiles.shape[1], cam_y + game.constants.map_view_height)
+        if left >= right or top >= bottom:
+            return
+        aoe_view = aoe_tiles[left - x0 : right - x0, top - y0 : bottom - y0]
+        console.tiles_rgb["bg"][left - cam_x : right - cam_x, top - cam_y : bottom - cam_y][aoe_view] = game.color.red
 
     def on_index_selected(self, x: int, y: int) -> Optional[game.actions.Action]:
         return self.callback((x, y))
@@ -544,6 +622,7 @@ def on_quit(self) -> None:
         """Handle exiting out of a finished game."""
         if os.path.exists("savegame.sav"):
             os.remove("savegame.sav")  # Deletes the active save file.
+        game.message_log.remove_histories(game.constants.message_history_dir)
         raise game.exceptions.QuitWithoutSaving()  # Avoid saving a finished game.
 
     def ev_quit(self, event: tcod.event.Quit) -> None:
@@ -567,8 +646,11 @@ class HistoryViewer(EventHandler):
 
     def __init__(self, engine: game.engine.Engine):
         super().__init__(engine)
-        self.log_length = len(engine.message_log.messages)
+        self.first = engine.message_log.first_index
+        self.log_length = engine.message_log.length
         self.cursor = self.log_length - 1
+        # The messages shown for the current cursor, as ((start, stop), messages).
+        self.page: Tuple[Tuple[int, int], List[game.message_log.Message]] = ((0, 0), [])
 
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)  # Draw the main state as the background.
@@ -579,6 +661,11 @@ def on_render(self, console: tcod.Console) -> None:
         log_console.draw_frame(0, 0, log_console.width, log_console.height)
         log_console.print_box(0, 0, log_console.width, 1, "┤Message history├", alignment=tcod.CENTER)
 
+        # Every message takes at least one line, so only one message per line is paged in up to the cursor.
+        page_range = max(self.first, self.cursor + 1 - (log_console.height - 2)), self.cursor + 1
+        if self.page[0] != page_range:
+            self.page = page_range, self.engine.message_log.get_range(*page_range)
+
         # Render the message log using the cursor parameter.
         self.engine.message_log.render_messages(
             log_console,
@@ -586,7 +673,7 @@ def on_render(self, console: tcod.Console) -> None:
             1,
             log_console.width - 2,
             log_console.height - 2,
-            self.engine.message_log.messages[: self.cursor + 1],
+            self.page[1],
         )
         log_console.blit(console, 3, 3)
 
@@ -594,17 +681,17 @@ def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
         # Fancy conditional movement to make it feel right.
         if event.sym in CURSOR_Y_KEYS:
             adjust = CURSOR_Y_KEYS[event.sym]
-            if adjust < 0 and self.cursor == 0:
+            if adjust < 0 and self.cursor == self.first:
                 # Only move from the top to the bottom when you're on the edge.
                 self.cursor = self.log_length - 1
             elif adjust > 0 and self.cursor == self.log_length - 1:
                 # Same with bottom to top movement.
-                self.cursor = 0
+                self.cursor = self.first
             else:
                 # Otherwise move while staying clamped to the bounds of the history log.
-                self.cursor = max(0, min(self.cursor + adjust, self.log_length - 1))
+                self.cursor = max(self.first, min(self.cursor + adjust, self.log_length - 1))
         elif event.sym == tcod.event.K_HOME:
-            self.cursor = 0  # Move directly to the top message.
+            self.cursor = self.first  # Move directly to the top message.
         elif event.sym == tcod.event.K_END:
             self.cursor = self.log_length - 1  # Move directly to the last message.
         else:  # Any other key moves back to the main game state.
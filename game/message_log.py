@@ -1,17 +1,38 @@
+from __future__ import annotations
+
+import array
+import collections
+import glob
+import itertools
+import json
+import logging
+import os
 import textwrap
-from typing import Iterable, List, Reversible, Tuple
+import uuid
+from typing import Any, BinaryIO, Deque, Dict, Iterable, Iterator, List, Optional, Reversible, Tuple
 
+import numpy as np
 import tcod
 
 import game.color
+import game.constants
+
+logger = logging.getLogger(__name__)
 
 
 class Message:
+    _wrapped: Optional[Tuple[int, int, List[str]]] = None  # Cached wrapped lines as (width, count, lines).
+
     def __init__(self, text: str, fg: Tuple[int, int, int]):
         self.plain_text = text
         self.fg = fg
         self.count = 1
 
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop("_wrapped", None)  # Cached data is not saved.
+        return state
+
     @property
     def full_text(self) -> str:
         """The full text of this message, including the count if necessary."""
@@ -19,10 +40,162 @@ def full_text(self) -> str:
             return f"{self.plain_text} (x{self.count})"
         return self.plain_text
 
+    def wrapped(self, width: int) -> List[str]:
+        """Return the full text of this message wrapped to `width`.
+
+        The lines are cached until the width or the stack count changes.
+        """
+        if self._wrapped is None or self._wrapped[:2] != (width, self.count):
+            self._wrapped = (width, self.count, list(MessageLog.wrap(self.full_text, width)))
+        return self._wrapped[2]
+
+
+def remove_histories(directory: str, keep: Optional[str] = None) -> None:
+    """Delete the history files in `directory`, other than the file at `keep`."""
+    for path in glob.glob(os.path.join(directory, "*.jsonl")):
+        if keep is not None and os.path.exists(keep) and os.path.samefile(path, keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            logger.exception("Could not remove the message history file %r.", path)
+
 
 class MessageLog:
+    _history_offsets: Optional[array.array[int]] = None  # The file offset of each archived message.
+    _history_file: Optional[BinaryIO] = None  # Messages are appended through this, opened when first needed.
+
     def __init__(self) -> None:
-        self.messages: List[Message] = []
+        # Only the most recent messages are kept.
+        self.messages: Deque[Message] = collections.deque(maxlen=game.constants.message_log_size)
+        self.length = 0  # Number of messages ever added to this log.
+        # Messages are appended to the history file once they can no longer stack.
+        self.history_path: Optional[str] = None
+        self.history_id = ""  # Written as the first line of the history file, to tell it apart from other games.
+        self.history_start = 0  # Size in bytes of the first line of the history file.
+        self.history_size = 0  # Size in bytes of the archived part of the history file.
+        self.archived = 0  # Number of messages in the history file.
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop("_history_offsets", None)  # Rebuilt from the history file when needed.
+        state.pop("_history_file", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Check that the history file still belongs to this log, otherwise only messages in memory are kept.
+
+        Saves from before the message history only have a list of messages, which are kept in memory.
+        """
+        self.__init__()  # type: ignore[misc]  # Defaults for anything missing from older saves.
+        self.__dict__.update(state)
+        if not isinstance(self.messages, collections.deque):
+            self.length = len(self.messages)
+            self.messages = collections.deque(self.messages, maxlen=game.constants.message_log_size)
+        if self.history_path is not None and not self._history_matches():
+            logger.warning("The message history file %r is missing or belongs to another game.", self.history_path)
+            self.history_path = None
+
+    def _history_matches(self) -> bool:
+        """Return True if the history file starts with the id of this log and holds at least its archived messages."""
+        assert self.history_path is not None
+        try:
+            with open(self.history_path, "rb") as f:
+                header = f.readline()
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+        except OSError:
+            return False
+        return bool(self.history_id) and header == self._history_header() and size >= self.history_size
+
+    def _history_header(self) -> bytes:
+        return json.dumps({"id": self.history_id}).encode() + b"\n"
+
+    def start_history(self, path: str) -> None:
+        """Start archiving the full message history to `path`, replacing any existing file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.history_id = uuid.uuid4().hex
+        header = self._history_header()
+        self._history_file = open(path, "w+b")
+        self._history_file.write(header)
+        self._history_file.flush()
+        self.history_path = path
+        self.history_start = self.history_size = len(header)
+        self.archived = 0
+        self._history_offsets = array.array("q")
+
+    @property
+    def first_index(self) -> int:
+        """The index of the oldest message which can be returned by `get_range`."""
+        if self.history_path is not None and os.path.isfile(self.history_path):
+            return 0
+        return self.length - len(self.messages)
+
+    def _archive(self, message: Message) -> None:
+        """Append a message to the end of the history file."""
+        assert self.history_path is not None
+        data = json.dumps([message.plain_text, message.fg, message.count], separators=(",", ":")).encode() + b"\n"
+        if self._history_file is None:
+            self._history_file = open(self.history_path, "r+b")
+            # Anything past the archived size was written after this log was saved, and is discarded.
+            self._history_file.seek(self.history_size)
+            self._history_file.truncate()
+        self._history_file.write(data)
+        self._history_file.flush()  # Read back by `get_range` through another file object.
+        offsets = self._history_offsets
+        if offsets is not None:
+            offsets.append(self.history_size)
+        self.history_size += len(data)
+        self.archived += 1
+
+    def _get_history_offsets(self) -> array.array[int]:
+        """Return the file offset of each archived message, indexing the history file if needed."""
+        if self._history_offsets is None:
+            assert self.history_path is not None
+            with open(self.history_path, "rb") as f:
+                f.seek(self.history_start)
+                data = np.frombuffer(f.read(self.history_size - self.history_start), dtype=np.uint8)
+            line_ends = np.flatnonzero(data == ord("\n")) + self.history_start
+            self._history_offsets = array.array(
+                "q", [self.history_start, *(line_ends[:-1] + 1).tolist()][: len(line_ends)]
+            )
+        return self._history_offsets
+
+    def _read_history(self, start: int, stop: int) -> List[Message]:
+        """Read the archived messages from `start` to `stop` from the history file."""
+        if start >= stop:
+            return []
+        offsets = self._get_history_offsets()
+        end = offsets[stop] if stop < len(offsets) else self.history_size
+        assert self.history_path is not None
+        with open(self.history_path, "rb") as f:
+            f.seek(offsets[start])
+            lines = f.read(end - offsets[start]).splitlines()
+        messages = []
+        for line in lines:
+            text, fg, count = json.loads(line)
+            message = Message(text, tuple(fg))
+            message.count = count
+            messages.append(message)
+        return messages
+
+    def get_range(self, start: int, stop: int) -> List[Message]:
+        """Return the messages from index `start` to `stop`, where index 0 is the first message ever added.
+
+        Recent messages are taken from memory, older messages are paged in from the history file.
+        """
+        start = max(start, self.first_index)
+        in_memory = self.length - len(self.messages)
+        older = self._read_history(start, min(stop, in_memory))
+        return older + list(itertools.islice(self.messages, max(0, start - in_memory), max(0, stop - in_memory)))
+
+    def search(self, text: str) -> Iterator[int]:
+        """Yield the index of each message containing `text`, from oldest to newest."""
+        page = 256
+        for start in range(self.first_index, self.length, page):
+            for i, message in enumerate(self.get_range(start, start + page), start):
+                if text in message.plain_text:
+                    yield i
 
     def add_message(self, text: str, fg: Tuple[int, int, int] = game.color.white, *, stack: bool = True) -> None:
         """Add a message to this log.
@@ -34,8 +207,11 @@ def add_message(self, text: str, fg: Tuple[int, int, int] = game.color.white, *,
         """
         if stack and self.messages and text == self.messages[-1].plain_text:
             self.messages[-1].count += 1
-        else:
-            self.messages.append(Message(text, fg))
+            return
+        if self.history_path is not None and self.archived < self.length:
+            self._archive(self.messages[-1])  # The last message can no longer stack.
+        self.messages.append(Message(text, fg))
+        self.length += 1
 
     def render(self, console: tcod.Console, x: int, y: int, width: int, height: int) -> None:
         """Render this log over the given area.
@@ -67,7 +243,7 @@ def render_messages(
         y_offset = height - 1
 
         for message in reversed(messages):
-            for line in reversed(list(cls.wrap(message.full_text, width))):
+            for line in reversed(message.wrapped(width)):
                 console.print(x=x, y=y + y_offset, string=line, fg=message.fg)
                 y_offset -= 1
                 if y_offset < 0:
@@ -0,0 +1,257 @@
+"""Hierarchical pathfinding for large maps.
+
+The map is split into square clusters.  Walkable openings along the border of two clusters become portal nodes, and
+the distances between the portals of each cluster are precomputed.  A path is found by searching this small abstract
+graph and then refining each step of the abstract path with a local search limited to a single cluster.
+"""
+from __future__ import annotations
+
+import heapq
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import tcod
+from numpy.typing import NDArray
+
+import game.game_map
+
+CLUSTER_SIZE = 16
+
+Window = Tuple[slice, slice]
+"""A 2D index into a map as (x_slice, y_slice)."""
+
+CostFunc = Callable[[Window], NDArray[np.int32]]
+"""A callback returning the movement cost for a window of the map."""
+
+Position = Tuple[int, int]
+Cluster = Tuple[int, int]
+
+
+def _octile(a: Position, b: Position) -> int:
+    """Return the octile distance between two positions using cardinal=2, diagonal=3 costs."""
+    dx = abs(a[0] - b[0])
+    dy = abs(a[1] - b[1])
+    return 2 * max(dx, dy) + min(dx, dy)
+
+
+def _local_path(cost: NDArray[np.int32], origin: Position, start: Position, goal: Position) -> List[Position]:
+    """Return the path from `start` to `goal` over a window of `cost` positioned at `origin`.
+
+    The returned path includes `start` and `goal` in map coordinates.  Returns an empty list if there is no path.
+    """
+    ox, oy = origin
+    graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
+    pathfinder = tcod.path.Pathfinder(graph)
+    pathfinder.add_root((start[0] - ox, start[1] - oy))
+    path: List[List[int]] = pathfinder.path_to((goal[0] - ox, goal[1] - oy)).tolist()
+    if not path or path[0] != [start[0] - ox, start[1] - oy]:
+        return []
+    return [(x + ox, y + oy) for x, y in path]
+
+
+class ClusterGraph:
+    """A precomputed portal graph over the walkable tiles of a GameMap.
+
+    Cluster data is rebuilt lazily, and only for the clusters marked by `invalidate`.
+    """
+
+    def __init__(self, gamemap: game.game_map.GameMap, cluster_size: int = CLUSTER_SIZE):
+        self.gamemap = gamemap
+        self.cluster_size = cluster_size
+        self.clusters_wide = -(-gamemap.width // cluster_size)
+        self.clusters_high = -(-gamemap.height // cluster_size)
+        # Portal pairs crossing the border between two clusters, keyed by the (left/top, right/bottom) clusters.
+        self._borders: Dict[Tuple[Cluster, Cluster], List[Tuple[Position, Position, int]]] = {}
+        # Distances between the portals inside of each cluster.
+        self._edges: Dict[Cluster, Dict[Position, Dict[Position, int]]] = {}
+        # Border crossings indexed by portal position, derived from `_borders`.
+        self._crossings: Dict[Position, List[Tuple[Position, int]]] = {}
+        self._dirty: Set[Cluster] = {(i, j) for i in range(self.clusters_wide) for j in range(self.clusters_high)}
+
+    def cluster_at(self, x: int, y: int) -> Cluster:
+        """Return the cluster index containing the map position."""
+        return x // self.cluster_size, y // self.cluster_size
+
+    def window(self, cluster: Cluster) -> Window:
+        """Return the map window covered by a cluster."""
+        i, j = cluster
+        size = self.cluster_size
+        return (
+            slice(i * size, min((i + 1) * size, self.gamemap.width)),
+            slice(j * size, min((j + 1) * size, self.gamemap.height)),
+        )
+
+    def invalidate(self, where: Any) -> None:
+        """Mark the clusters overlapping the map index `where` as needing to be rebuilt."""
+        size = self.cluster_size
+        padded = np.zeros((self.clusters_wide * size, self.clusters_high * size), dtype=bool)
+        padded[: self.gamemap.width, : self.gamemap.height][where] = True
+        touched = padded.reshape(self.clusters_wide, size, self.clusters_high, size).any(axis=(1, 3))
+        self._dirty.update((i, j) for i, j in np.argwhere(touched).tolist())
+
+    def _neighbors(self, cluster: Cluster) -> Iterator[Cluster]:
+        i, j = cluster
+        for ni, nj in ((i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1)):
+            if 0 <= ni < self.clusters_wide and 0 <= nj < self.clusters_high:
+                yield ni, nj
+
+    def _build_border(self, a: Cluster, b: Cluster) -> None:
+        """Find the portals between two adjacent clusters, `a` must be left of or above `b`."""
+        tiles = self.gamemap.tiles
+        wa, wb = self.window(a), self.window(b)
+        horizontal = a[1] == b[1]
+        if horizontal:
+            side_a = tiles[wa[0].stop - 1, wa[1]]
+            side_b = tiles[wb[0].start, wb[1]]
+        else:
+            side_a = tiles[wa[0], wa[1].stop - 1]
+            side_b = tiles[wb[0], wb[1].start]
+        open_: NDArray[np.bool_] = (side_a != 0) & (side_b != 0)
+        portals: List[Tuple[Position, Position, int]] = []
+        # Place one portal at the middle of each contiguous opening along the border.
+        edges = np.diff(np.concatenate([[0], open_.astype(np.int8), [0]]))
+        for begin, end in zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()):
+            mid = (begin + end - 1) // 2
+            if horizontal:
+                pos_a = (wa[0].stop - 1, wa[1].start + mid)
+                pos_b = (wb[0].start, wb[1].start + mid)
+            else:
+                pos_a = (wa[0].start + mid, wa[1].stop - 1)
+                pos_b = (wb[0].start + mid, wb[1].start)
+            portals.append((pos_a, pos_b, 2 * int(max(tiles[pos_a], tiles[pos_b]))))
+        self._borders[a, b] = portals
+
+    def _portals(self, cluster: Cluster) -> Set[Position]:
+        """Return the portal positions inside of a cluster."""
+        portals: Set[Position] = set()
+        for other in self._neighbors(cluster):
+            if cluster < other:
+                portals.update(pos_a for pos_a, _, _ in self._borders.get((cluster, other), ()))
+            else:
+                portals.update(pos_b for _, pos_b, _ in self._borders.get((other, cluster), ()))
+        return portals
+
+    def _distances_from(self, cluster: Cluster, start: Position, cost: NDArray[np.int32]) -> NDArray[np.int32]:
+        """Return the distance array from `start` over the tile cost of a cluster."""
+        wx, wy = self.window(cluster)
+        dist = tcod.path.maxarray(cost.shape, dtype=np.int32, order="F")
+        dist[start[0] - wx.start, start[1] - wy.start] = 0
+        tcod.path.dijkstra2d(dist, cost, cardinal=2, diagonal=3, out=dist)
+        return dist
+
+    def _build_edges(self, cluster: Cluster) -> None:
+        """Compute the distances between all portals of a cluster."""
+        wx, wy = self.window(cluster)
+        cost = self.gamemap.tiles[wx, wy].astype(np.int32)
+        portals = sorted(self._portals(cluster))
+        unreachable = np.iinfo(np.int32).max
+        edges: Dict[Position, Dict[Position, int]] = {}
+        for portal in portals:
+            dist = self._distances_from(cluster, portal, cost)
+            edges[portal] = {
+                other: int(dist[other[0] - wx.start, other[1] - wy.start])
+                for other in portals
+                if other != portal and dist[other[0] - wx.start, other[1] - wy.start] != unreachable
+            }
+        self._edges[cluster] = edges
+
+    def update(self) -> None:
+        """Rebuild the portals and portal distances of any invalidated clusters."""
+        if not self._dirty:
+            return
+        dirty = self._dirty
+        self._dirty = set()
+        borders = {
+            (min(cluster, other), max(cluster, other)) for cluster in dirty for other in self._neighbors(cluster)
+        }
+        for a, b in borders:
+            self._build_border(a, b)
+        for cluster in dirty.union(*borders):  # The portals of neighbors may have changed.
+            self._build_edges(cluster)
+        self._crossings = {}
+        for portals in self._borders.values():
+            for pos_a, pos_b, step_cost in portals:
+                self._crossings.setdefault(pos_a, []).append((pos_b, step_cost))
+                self._crossings.setdefault(pos_b, []).append((pos_a, step_cost))
+
+    def _link(
+        self, position: Position, cost: NDArray[np.int32], window: Window, cluster: Cluster
+    ) -> Dict[Position, int]:
+        """Return the distances from a position to the portals of its cluster."""
+        dist = self._distances_from(cluster, position, cost)
+        unreachable = np.iinfo(np.int32).max
+        links = {}
+        for portal in self._edges[cluster]:
+            if portal == position:
+                continue
+            d = int(dist[portal[0] - window[0].start, portal[1] - window[1].start])
+            if d != unreachable:
+                links[portal] = d
+        return links
+
+    def _abstract_path(self, start: Position, goal: Position) -> Optional[List[Position]]:
+        """Search the portal graph, returns the list of nodes from start to goal or None."""
+        start_cluster = self.cluster_at(*start)
+        goal_cluster = self.cluster_at(*goal)
+        start_window, goal_window = self.window(start_cluster), self.window(goal_cluster)
+        start_cost = self.gamemap.tiles[start_window].astype(np.int32)
+        goal_cost = start_cost if start_cluster == goal_cluster else self.gamemap.tiles[goal_window].astype(np.int32)
+        start_links = self._link(start, start_cost, start_window, start_cluster)
+        goal_links = self._link(goal, goal_cost, goal_window, goal_cluster)
+
+        # The start is expanded like any other node, it can also be a portal with its own border crossings.
+        open_heap: List[Tuple[int, int, Position]] = [(_octile(start, goal), 0, start)]
+        best: Dict[Position, int] = {start: 0}
+        came_from: Dict[Position, Position] = {}
+        while open_heap:
+            _, dist, node = heapq.heappop(open_heap)
+            if node == goal:
+                path = [goal]
+                while path[-1] != start:
+                    path.append(came_from[path[-1]])
+                return path[::-1]
+            if dist > best.get(node, dist):
+                continue  # Stale entry.
+            if node == start:
+                successors = list(start_links.items())
+            else:
+                successors = list(self._edges[self.cluster_at(*node)].get(node, {}).items())
+            successors += self._crossings.get(node, [])
+            if node in goal_links:
+                successors.append((goal, goal_links[node]))
+            for successor, step in successors:
+                new_dist = dist + step
+                if new_dist < best.get(successor, new_dist + 1):
+                    best[successor] = new_dist
+                    came_from[successor] = node
+                    heapq.heappush(open_heap, (new_dist + _octile(successor, goal), new_dist, successor))
+        return None
+
+    def path_to(self, start: Position, goal: Position, cost_func: CostFunc) -> List[Position]:
+        """Return a path from `start` to `goal`, not including `start`.
+
+        `cost_func` provides the detailed costs used to refine the abstract path, such as the costs of blocking
+        entities.  Returns an empty list if there is no valid path.
+        """
+        self.update()
+        start_cluster = self.cluster_at(*start)
+        if start_cluster == self.cluster_at(*goal):
+            window = self.window(start_cluster)
+            path = _local_path(cost_func(window), (window[0].start, window[1].start), start, goal)
+            if path:
+                return path[1:]
+        nodes = self._abstract_path(start, goal)
+        if nodes is None:
+            return []
+        result: List[Position] = []
+        for node_a, node_b in zip(nodes, nodes[1:]):
+            cluster = self.cluster_at(*node_a)
+            if cluster != self.cluster_at(*node_b):
+                result.append(node_b)  # Crossing a border between clusters.
+                continue
+            window = self.window(cluster)
+            segment = _local_path(cost_func(window), (window[0].start, window[1].start), node_a, node_b)
+            if not segment:
+                return []
+            result.extend(segment[1:])
+        return result
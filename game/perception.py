@@ -0,0 +1,62 @@
+"""Field of view for NPCs with their own sight radius."""
+from __future__ import annotations
+
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+import tcod
+from numpy.typing import NDArray
+
+import game.game_map
+
+Viewer = Tuple[int, int, int]
+"""A viewer as (x, y, radius)."""
+
+
+class Perception:
+    """Computes and caches radius limited FOV for many viewers.
+
+    Each FOV is computed on a window around the viewer no larger than its radius, and is reused until the viewer
+    moves or the opacity of the map changes.
+    """
+
+    def __init__(self, gamemap: game.game_map.GameMap):
+        self.gamemap = gamemap
+        # Cached FOV windows keyed by viewer, as (opacity_version, window_origin, visible_window).
+        self._cache: Dict[Viewer, Tuple[int, Tuple[int, int], NDArray[np.bool_]]] = {}
+
+    def _compute(self, viewer: Viewer) -> Tuple[int, Tuple[int, int], NDArray[np.bool_]]:
+        x, y, radius = viewer
+        x0, y0 = max(0, x - radius), max(0, y - radius)
+        x1, y1 = min(self.gamemap.width, x + radius + 1), min(self.gamemap.height, y + radius + 1)
+        visible = tcod.map.compute_fov(
+            self.gamemap.transparency[x0:x1, y0:y1],
+            (x - x0, y - y0),
+            radius=radius,
+            algorithm=tcod.FOV_SYMMETRIC_SHADOWCAST,
+        )
+        return self.gamemap.opacity_version, (x0, y0), visible
+
+    def update(self, viewers: Iterable[Viewer]) -> None:
+        """Compute the FOV of all `viewers`, skipping viewers whose cached FOV is still valid.
+
+        Cached results for viewers not in `viewers` are discarded.
+        """
+        version = self.gamemap.opacity_version
+        cache: Dict[Viewer, Tuple[int, Tuple[int, int], NDArray[np.bool_]]] = {}
+        for viewer in viewers:
+            if viewer in cache:
+                continue
+            cached = self._cache.get(viewer)
+            cache[viewer] = cached if cached is not None and cached[0] == version else self._compute(viewer)
+        self._cache = cache
+
+    def can_see(self, viewer: Viewer, x: int, y: int) -> bool:
+        """Return True if `viewer` can see the position `x`, `y`."""
+        cached = self._cache.get(viewer)
+        if cached is None or cached[0] != self.gamemap.opacity_version:
+            cached = self._cache[viewer] = self._compute(viewer)
+        _, (x0, y0), visible = cached
+        x -= x0
+        y -= y0
+        return 0 <= x < visible.shape[0] and 0 <= y < visible.shape[1] and bool(visible[x, y])
@@ -1,22 +1,27 @@
 from __future__ import annotations
 
+import functools
 import logging
 import random
-from typing import Dict, Iterator, List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
+import scipy.ndimage  # type: ignore
 import scipy.signal  # type: ignore
 import tcod
-import wfc.wfc_control
 from numpy.typing import NDArray
 
 import game
 import game.components.consumable
+import game.constants
 import game.engine
 import game.entity
 import game.entity_factories
 import game.game_map
+import game.profiler
+import game.simulation
 import game.tiles
+import game.wfc_cache
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +30,16 @@
 DOWN_STAIRS = 2
 OUTDOORS = 3
 
+WFC_PATTERN = "pattern4.txt"
+WFC_OPTIONS: Dict[str, Any] = {
+    "pattern_width": 3,
+    "output_periodic": False,
+    "input_periodic": False,
+    "input_ground": ((1, 1), (1, 1)),
+    "output_ground": ((1, 3), (1, 3)),
+}
+"""Options for wfc.wfc_control.execute_wfc, other than the sample image and output size."""
+
 max_items_by_floor = [
     (1, 1),
     (4, 2),
@@ -67,6 +82,7 @@ def get_entities_at_random(
     weighted_chances_by_floor: Dict[int, List[Tuple[game.entity.Entity, int]]],
     number_of_entities: int,
     floor: int,
+    rng: random.Random,
 ) -> List[game.entity.Entity]:
     entity_weighted_chances = {}
 
@@ -83,7 +99,7 @@ def get_entities_at_random(
     entities = list(entity_weighted_chances.keys())
     entity_weighted_chance_values = list(entity_weighted_chances.values())
 
-    chosen_entities = random.choices(entities, weights=entity_weighted_chance_values, k=number_of_entities)
+    chosen_entities = rng.choices(entities, weights=entity_weighted_chance_values, k=number_of_entities)
 
     return chosen_entities
 
@@ -110,16 +126,18 @@ def intersects(self, other: RectangularRoom) -> bool:
         return self.x1 <= other.x2 and self.x2 >= other.x1 and self.y1 <= other.y2 and self.y2 >= other.y1
 
 
-def place_entities(room: RectangularRoom, dungeon: game.game_map.GameMap, floor_number: int) -> None:
-    number_of_monsters = random.randint(0, get_max_value_for_floor(max_monsters_by_floor, floor_number))
-    number_of_items = random.randint(0, get_max_value_for_floor(max_items_by_floor, floor_number))
+def place_entities(
+    room: RectangularRoom, dungeon: game.game_map.GameMap, floor_number: int, rng: random.Random
+) -> None:
+    number_of_monsters = rng.randint(0, get_max_value_for_floor(max_monsters_by_floor, floor_number))
+    number_of_items = rng.randint(0, get_max_value_for_floor(max_items_by_floor, floor_number))
 
-    monsters: List[game.entity.Entity] = get_entities_at_random(enemy_chances, number_of_monsters, floor_number)
-    items: List[game.entity.Entity] = get_entities_at_random(item_chances, number_of_items, floor_number)
+    monsters: List[game.entity.Entity] = get_entities_at_random(enemy_chances, number_of_monsters, floor_number, rng)
+    items: List[game.entity.Entity] = get_entities_at_random(item_chances, number_of_items, floor_number, rng)
 
     for entity in monsters + items:
-        x = random.randint(room.x1 + 1, room.x2 - 1)
-        y = random.randint(room.y1 + 1, room.y2 - 1)
+        x = rng.randint(room.x1 + 1, room.x2 - 1)
+        y = rng.randint(room.y1 + 1, room.y2 - 1)
 
         if dungeon.get_blocking_entity_at(x, y):
             continue
@@ -129,13 +147,11 @@ def place_entities(room: RectangularRoom, dungeon: game.game_map.GameMap, floor_
         entity.spawn(dungeon, x, y)
 
 
-def tunnel_between(
-    engine: game.engine.Engine, start: Tuple[int, int], end: Tuple[int, int]
-) -> Iterator[Tuple[int, int]]:
+def tunnel_between(rng: random.Random, start: Tuple[int, int], end: Tuple[int, int]) -> Iterator[Tuple[int, int]]:
     """Return an L-shaped tunnel between these two points."""
     x1, y1 = start
     x2, y2 = end
-    if engine.rng.random() < 0.5:  # 50% chance.
+    if rng.random() < 0.5:  # 50% chance.
         corner_x, corner_y = x2, y1  # Move horizontally, then vertically.
     else:
         corner_x, corner_y = x1, y2  # Move vertically, then horizontally.
@@ -147,90 +163,259 @@ def tunnel_between(
         yield x, y
 
 
-def load_pattern(name: str) -> NDArray[np.uint8]:
+@functools.lru_cache(maxsize=None)
+def _read_pattern(name: str) -> NDArray[np.uint8]:
+    """Return the read-only sample image of a pattern file, read once per process."""
     pattern_txt = (game.DATA_DIR / name).read_text(encoding="utf-8").strip().splitlines()
     pattern: NDArray[np.uint8] = np.asarray([[ord(c) for c in row] for row in pattern_txt], dtype=np.uint8)
     pattern = pattern[:, :, np.newaxis]
+    pattern.flags.writeable = False
     return pattern
 
 
-def generate_dungeon(
-    max_rooms: int,
-    room_min_size: int,
-    room_max_size: int,
-    map_width: int,
-    map_height: int,
-    engine: game.engine.Engine,
-) -> game.game_map.GameMap:
-    """Generate a new dungeon map."""
-    dungeon = game.game_map.GameMap(engine, map_width, map_height)
-    dungeon.parent = engine
+def load_pattern(name: str) -> NDArray[np.uint8]:
+    """Return the sample image of a pattern file from the data directory, each pattern file is only read once."""
+    pattern: NDArray[np.uint8] = _read_pattern(name).copy()
+    return pattern
 
-    gen = wfc.wfc_control.execute_wfc(
-        image=load_pattern("pattern4.txt"),
-        pattern_width=3,
-        output_size=(map_height, map_width),
-        output_periodic=False,
-        input_periodic=False,
-        input_ground=((1, 1), (1, 1)),
-        output_ground=((1, 3), (1, 3)),
-    )[:, :, 0].T
 
-    dungeon.tiles[gen == ord("#")] = WALL
-    dungeon.tiles[gen == ord(".")] = OUTDOORS
-    dungeon.tiles[gen == ord("1")] = FLOOR
+def _find_root(parents: Dict[int, int], node: int) -> int:
+    """Return the representative of a node in a union-find forest, compressing the path to it."""
+    root = node
+    while parents[root] != root:
+        root = parents[root]
+    while parents[node] != root:
+        parents[node], node = root, parents[node]
+    return root
 
-    logger.info("Making indoor areas accessible.")
 
-    accessible_path = tcod.path.maxarray((map_width, map_height), order="F")  # Accessible area distance-path.
-    accessible_path[gen == ord(".")] = 0  # Initialize with outdoors.
-    unaccessible_zone = gen == ord("1")  # Connect to the innder room area.
+def connect_indoor_areas(dungeon: game.game_map.GameMap) -> None:
+    """Carve paths through walls so that every indoor area can be reached from outdoors.
 
+    Open areas are labeled, and all areas touching the outdoors count as a single accessible area.  One multi-source
+    search through the walls from every open tile finds the cheapest crossings between each pair of areas.  Then the
+    crossings of a minimum spanning tree over the areas are carved.
+    """
+    tiles = dungeon.tiles
     CARDINAL: NDArray[np.int8] = np.asarray([[0, 1, 0], [1, 0, 1], [0, 1, 0]], dtype=np.int8)
 
-    while unaccessible_zone.any():
-        cost: NDArray[np.int32] = np.zeros((map_width, map_height), dtype=np.int32, order="F")
-        cost[dungeon.tiles == WALL] = 5
-        cost[dungeon.tiles == OUTDOORS] = 10
-        cost[dungeon.tiles == FLOOR] = 1
-
-        cost = scipy.signal.convolve2d(cost, CARDINAL, "same")
-        cost[dungeon.tiles != WALL] = 0
-        cost[dungeon.tiles == OUTDOORS] = 1
-        cost[dungeon.tiles == FLOOR] = 1
-
-        graph = tcod.path.SimpleGraph(cost=cost, cardinal=1, diagonal=0)
-        pf = tcod.path.Pathfinder(graph)
-        accessible_root = random.choice(np.argwhere(accessible_path != np.iinfo(accessible_path.dtype).max))
-        pf.add_root(accessible_root)
-        path = pf.path_from(random.choice(np.argwhere(unaccessible_zone)))
+    is_open = tiles != WALL
+    labels, _ = scipy.ndimage.label(is_open, structure=CARDINAL)
+    area: NDArray[np.intp] = labels.astype(np.intp)
+    area[area == 0] = -1  # Walls.
+    area[np.isin(labels, labels[tiles == OUTDOORS])] = 0  # Everything connected to the outdoors.
+    game.profiler.count("procgen.areas", len(np.unique(area[is_open])))
+    if np.array_equal(np.unique(area[is_open]), [0]):
+        return  # Already connected.
+
+    # Walls are cheaper to carve when they have fewer open neighbors, outdoors counts the most.
+    cost: NDArray[np.int32] = np.zeros(tiles.shape, dtype=np.int32, order="F")
+    cost[tiles == WALL] = 5
+    cost[tiles == OUTDOORS] = 10
+    cost[tiles == FLOOR] = 1
+    cost = scipy.signal.convolve2d(cost, CARDINAL, "same")
+    cost[is_open] = 1
+
+    # Search from every open tile at once, each wall is reached from its nearest area.
+    pf = tcod.path.Pathfinder(tcod.path.SimpleGraph(cost=cost, cardinal=1, diagonal=0))
+    pf.distance[is_open] = 0
+    pf.rebuild_frontier()
+    pf.resolve()
+    distance = pf.distance.astype(np.int64)
+    reached = distance != np.iinfo(pf.distance.dtype).max
+
+    # Follow the traversal pointers to their roots by pointer jumping, giving the area each tile was reached from.
+    traversal = pf.traversal
+    parent = np.ravel_multi_index((traversal[..., 0], traversal[..., 1]), tiles.shape).ravel()
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            break
+        parent = grandparent
+    source = area.ravel()[parent].reshape(tiles.shape)
+    source[~reached] = -1
+
+    # Candidate crossings are neighboring tiles reached from different areas, keep the cheapest for each pair.
+    width, height = tiles.shape
+    areas = int(area.max()) + 1  # Pairs of areas are encoded as `area_a * areas + area_b`.
+    crossings = []
+    for dx, dy in ((1, 0), (0, 1)):
+        source_a, source_b = source[: width - dx, : height - dy], source[dx:, dy:]
+        index_a = np.nonzero((source_a != source_b) & (source_a >= 0) & (source_b >= 0))
+        index_b = index_a[0] + dx, index_a[1] + dy
+        crossings.append(
+            (
+                distance[index_a] + distance[index_b],
+                np.minimum(source[index_a], source[index_b]) * areas + np.maximum(source[index_a], source[index_b]),
+                np.ravel_multi_index(index_a, tiles.shape),
+                np.ravel_multi_index(index_b, tiles.shape),
+            )
+        )
+    weight, pair, tile_a, tile_b = (np.concatenate(column) for column in zip(*crossings))
+    by_pair = np.lexsort((weight, pair))
+    _, first = np.unique(pair[by_pair], return_index=True)
+    cheapest = by_pair[first]
+    cheapest = cheapest[np.argsort(weight[cheapest], kind="stable")]
+
+    # Kruskal's algorithm over the cheapest crossings, carving the crossings of the spanning tree.
+    parents = {int(i): int(i) for i in np.unique(area[is_open])}
+    for i in cheapest.tolist():
+        root_a = _find_root(parents, int(pair[i]) // areas)
+        root_b = _find_root(parents, int(pair[i]) % areas)
+        if root_a == root_b:
+            continue
+        parents[root_b] = root_a
+        game.profiler.count("procgen.paths_carved")
+        path = np.concatenate(
+            [
+                pf.path_from(np.unravel_index(tile_a[i], tiles.shape)),
+                pf.path_from(np.unravel_index(tile_b[i], tiles.shape)),
+            ]
+        )
         path_indexes = tuple(path.T)
-        path_values = dungeon.tiles[path_indexes]
+        path_values = tiles[path_indexes]
         path_doorways = path[path_values == WALL]
         logger.info(f"Opening path with walls={(path_values == WALL).sum()}, length={len(path)}.")
         path_values[path_values == WALL] = FLOOR
-        dungeon.tiles[path_indexes] = path_values
+        tiles[path_indexes] = path_values
+        dungeon.tiles_changed(path_indexes)
         for x, y in path_doorways.tolist():
             assert isinstance(x, int)
             assert isinstance(y, int)
             # game.entity_factories.door_test.spawn(dungeon, x, y)
 
-        tcod.path.dijkstra2d(
-            accessible_path, cost=dungeon.tiles == FLOOR, cardinal=1, diagonal=None, out=accessible_path
-        )
-        unaccessible_zone &= accessible_path == np.iinfo(accessible_path.dtype).max
 
-    dungeon.fuel = game.tiles.tile_fuel[dungeon.tiles]
+def floor_rng(seed: int, floor: int, stream: str) -> random.Random:
+    """Return the random generator of one part of the generation of a floor.
+
+    Each part has its own stream so that changing how much randomness one part uses does not affect the others.
+    """
+    return random.Random(f"{seed}:{floor}:{stream}")
+
+
+def layout_seed(seed: int, floor: int, stream: str = "layout") -> int:
+    """Return the WFC seed of the layout of a floor, or of a chunk of an open world if `stream` names one."""
+    return floor_rng(seed, floor, stream).getrandbits(32)
+
+
+def layout_options(width: int, height: int) -> Dict[str, Any]:
+    """Return the options of game.wfc_cache.execute_wfc for a layout of the given size."""
+    return {"output_size": (height, width), **WFC_OPTIONS}
 
-    for x, y in random.sample(np.argwhere(gen == ord("1")).tolist(), 3):
-        dungeon.fire[x, y] += 20
-        dungeon.fuel[x, y] += 20 * 10
-        dungeon.memory[x, y]["ch"] = ord("?")
 
-    for x, y in random.sample(np.argwhere(gen == ord("1")).tolist(), 10):
-        game.entity_factories.civ.spawn(dungeon, x, y)
-        dungeon.memory[x, y]["ch"] = ord("?")
+def take_prefilled_seed(width: int, height: int) -> Optional[int]:
+    """Return the seed of a game whose layouts were generated ahead of time by game.wfc_cache, or None."""
+    return game.wfc_cache.take_game_seed(load_pattern(WFC_PATTERN), **layout_options(width, height))
+
+
+def _generate_layout(seed: int, floor: int, stream: str, width: int, height: int) -> NDArray[np.uint8]:
+    """Return the WFC layout of a map as characters, indexed by [x, y]."""
+    layout: NDArray[np.uint8] = game.wfc_cache.execute_wfc(
+        load_pattern(WFC_PATTERN),
+        seed=layout_seed(seed, floor, stream),
+        **layout_options(width, height),
+    )[:, :, 0].T
+    return layout
+
+
+def _apply_layout(dungeon: game.game_map.GameMap, gen: NDArray[np.uint8]) -> None:
+    """Set the tiles of a map from a WFC layout."""
+    dungeon.tiles[gen == ord("#")] = WALL
+    dungeon.tiles[gen == ord(".")] = OUTDOORS
+    dungeon.tiles[gen == ord("1")] = FLOOR
+    dungeon.tiles_changed(np.s_[:, :])
+
+
+def _populate(
+    dungeon: game.game_map.GameMap,
+    gen: NDArray[np.uint8],
+    fire_rng: random.Random,
+    entity_rng: random.Random,
+    *,
+    fires: int,
+    civilians: int,
+) -> None:
+    """Start fires and place civilians on the indoor tiles of the WFC layout `gen`."""
+    indoors = np.argwhere(gen == ord("1")).tolist()
+    with game.profiler.section("procgen.fire"):
+        dungeon.fuel = game.tiles.tile_fuel[dungeon.tiles]
+
+        for x, y in fire_rng.sample(indoors, min(fires, len(indoors))):
+            dungeon.fire[x, y] += 20
+            dungeon.fuel[x, y] += 20 * 10
+            dungeon.memory[x, y]["ch"] = ord("?")
+
+    with game.profiler.section("procgen.entities"):
+        for x, y in entity_rng.sample(indoors, min(civilians, len(indoors))):
+            game.entity_factories.civ.spawn(dungeon, x, y)
+            dungeon.memory[x, y]["ch"] = ord("?")
+
+
+def generate_dungeon(
+    max_rooms: int,
+    room_min_size: int,
+    room_max_size: int,
+    map_width: int,
+    map_height: int,
+    seed: int,
+    floor: int,
+    engine: Optional[game.engine.Engine] = None,
+) -> game.game_map.GameMap:
+    """Generate a new dungeon map, the same `seed` and `floor` always generate the same map.
+
+    If `engine` is None then the map is generated for a placeholder engine, and must be moved to the real engine with
+    `GameMap.attach`.  This is how maps are generated in other processes.
+    """
+    if engine is None:
+        engine = game.engine.Engine()
+    dungeon = game.game_map.GameMap(engine, map_width, map_height)
+    dungeon.parent = engine
+
+    with game.profiler.section("procgen.wfc"):
+        gen = _generate_layout(seed, floor, "layout", map_width, map_height)
+    _apply_layout(dungeon, gen)
+
+    logger.info("Making indoor areas accessible.")
+    with game.profiler.section("procgen.connect"):
+        connect_indoor_areas(dungeon)
+
+    _populate(dungeon, gen, floor_rng(seed, floor, "fire"), floor_rng(seed, floor, "entities"), fires=3, civilians=10)
 
     dungeon.enter_xy = (1, 1)
+    game.simulation.update_hazard(dungeon)
 
     return dungeon
+
+
+def generate_chunk(
+    engine: game.engine.Engine, size: int, seed: int, floor: int, chunk_x: int, chunk_y: int
+) -> game.game_map.GameMap:
+    """Generate one chunk of an open world, the same arguments always generate the same chunk.
+
+    The edge of every chunk is outdoors, so neighboring chunks always join up no matter how each was generated.
+    The returned map is not attached to `engine`, its tiles and entities are meant to be moved into a larger map.
+    """
+    chunk = game.game_map.GameMap(engine, size, size)
+    chunk_name = f"{chunk_x},{chunk_y}"
+    with game.profiler.section("procgen.wfc"):
+        gen = _generate_layout(seed, floor, f"layout:{chunk_name}", size, size)
+    # Indoor tiles next to the outdoor edge become walls, otherwise rooms would be left open to the edge.
+    edge = np.zeros(gen.shape, dtype=bool)
+    edge[:2, :] = edge[-2:, :] = edge[:, :2] = edge[:, -2:] = True
+    gen[edge & (gen == ord("1"))] = ord("#")
+    gen[[0, -1], :] = gen[:, [0, -1]] = ord(".")
+    _apply_layout(chunk, gen)
+
+    with game.profiler.section("procgen.connect"):
+        connect_indoor_areas(chunk)
+
+    area_scale = size * size / (game.constants.map_width * game.constants.map_height)
+    _populate(
+        chunk,
+        gen,
+        floor_rng(seed, floor, f"fire:{chunk_name}"),
+        floor_rng(seed, floor, f"entities:{chunk_name}"),
+        fires=round(3 * area_scale),
+        civilians=round(10 * area_scale),
+    )
+    return chunk
@@ -0,0 +1,113 @@
+"""Benchmark and quality report for dungeon generation, results are printed as JSON.
+
+    python -m game.procgen_benchmark --sizes 50 100 --seeds 0 1 2
+
+WFC runs on every generation unless `--cache` is given, the layout cache is redirected to a temporary directory.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator
+
+import numpy as np
+import scipy.ndimage  # type: ignore
+
+import game.constants
+import game.engine  # noqa: F401  # Imported before game.game_map to avoid a circular import.
+import game.game_map
+import game.procgen
+import game.profiler
+
+SECTIONS = ("procgen.wfc", "procgen.connect", "procgen.fire", "procgen.entities")
+"""The profiler sections of generate_dungeon which are reported."""
+
+
+def reachable_indoor_share(gamemap: game.game_map.GameMap) -> float:
+    """Return the share of indoor floor tiles which can be walked to from outdoors."""
+    tiles = gamemap.tiles
+    labels, _ = scipy.ndimage.label(tiles != game.procgen.WALL, structure=[[0, 1, 0], [1, 1, 1], [0, 1, 0]])
+    indoor = tiles == game.procgen.FLOOR
+    if not indoor.any():
+        return 1.0
+    reachable = np.isin(labels, labels[tiles == game.procgen.OUTDOORS]) & indoor
+    return float(reachable.sum() / indoor.sum())
+
+
+@contextlib.contextmanager
+def _empty_wfc_cache(empty: bool) -> Iterator[None]:
+    """Redirect the WFC cache to an empty temporary directory if `empty` is True."""
+    if not empty:
+        yield
+        return
+    previous = game.constants.wfc_cache_dir
+    with tempfile.TemporaryDirectory() as cache_dir:
+        game.constants.wfc_cache_dir = cache_dir
+        try:
+            yield
+        finally:
+            game.constants.wfc_cache_dir = previous
+
+
+def _generate(width: int, height: int, seed: int, floor: int, cache: bool) -> game.game_map.GameMap:
+    """Generate a floor, with an empty WFC cache unless `cache` is True."""
+    with _empty_wfc_cache(not cache):
+        return game.procgen.generate_dungeon(
+            max_rooms=game.constants.max_rooms,
+            room_min_size=game.constants.room_min_size,
+            room_max_size=game.constants.room_max_size,
+            map_width=width,
+            map_height=height,
+            seed=seed,
+            floor=floor,
+        )
+
+
+def benchmark(width: int, height: int, seed: int, floor: int = 1, *, cache: bool = False) -> Dict[str, Any]:
+    """Generate one floor and return its timings, memory use, counters and quality.
+
+    Peak memory is measured by generating the floor again with tracemalloc, which would inflate the timings.
+    """
+    game.profiler.samples.clear()
+    game.profiler.counters.clear()
+    start = time.perf_counter()
+    gamemap = _generate(width, height, seed, floor, cache)
+    total = time.perf_counter() - start
+    sections = {name: sum(game.profiler.samples.get(name, ())) for name in SECTIONS}
+    counters = dict(game.profiler.counters)
+
+    tracemalloc.start()
+    _generate(width, height, seed, floor, cache)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "width": width,
+        "height": height,
+        "seed": seed,
+        "floor": floor,
+        "time": total,
+        "sections": sections,
+        "peak_memory": peak,
+        "counters": counters,
+        "reachable_indoor_share": reachable_indoor_share(gamemap),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark dungeon generation and print the results as JSON.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100], help="Widths and heights of square maps.")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--cache", action="store_true", help="Use the WFC layout cache instead of an empty one.")
+    args = parser.parse_args()
+
+    game.profiler.enabled = True
+    results = [benchmark(size, size, seed, cache=args.cache) for size in args.sizes for seed in args.seeds]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
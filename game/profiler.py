@@ -0,0 +1,125 @@
+"""Timing of the phases of each frame and turn.
+
+Sections are timed with `section` and kept in a rolling window of samples per section name.
+Nothing is recorded while `enabled` is False, in which case `section` returns a shared no-op context manager.
+"""
+from __future__ import annotations
+
+import collections
+import contextlib
+import json
+import time
+from typing import Any, ContextManager, Deque, Dict, Optional, Type
+
+import numpy as np
+import tcod
+from numpy.typing import NDArray
+
+import game.color
+
+enabled = False
+"""True if sections should be timed, toggled in-game with F9."""
+
+HISTORY = 240
+"""Number of recent samples kept for each section."""
+
+HISTOGRAM_EDGES_MS = (0.0, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, float("inf"))
+"""Bucket edges used when exporting the histogram of each section, in milliseconds."""
+
+samples: Dict[str, Deque[float]] = {}
+"""The recent durations of each section in seconds, keyed by section name."""
+
+counters: Dict[str, int] = {}
+"""Event counts, keyed by counter name."""
+
+_NULL_SECTION: ContextManager[None] = contextlib.nullcontext()
+
+
+class _Section:
+    """Times the block of a with statement and records it under `name`."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]], exc: Optional[BaseException], tb: Any) -> None:
+        elapsed = time.perf_counter() - self.start
+        history = samples.get(self.name)
+        if history is None:
+            history = samples.setdefault(self.name, collections.deque(maxlen=HISTORY))
+        history.append(elapsed)
+
+
+def section(*name: str) -> ContextManager[None]:
+    """Return a context manager which times its block under a name joined from `name` with dots.
+
+    Returns a shared no-op context manager when profiling is disabled.
+    """
+    if not enabled:
+        return _NULL_SECTION
+    return _Section(".".join(name))
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Add `amount` to the counter `name`, does nothing when profiling is disabled."""
+    if enabled:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def toggle() -> None:
+    """Enable or disable profiling, clearing the old samples when enabled."""
+    global enabled
+    enabled = not enabled
+    if enabled:
+        samples.clear()
+        counters.clear()
+
+
+def summary() -> Dict[str, Dict[str, Any]]:
+    """Return the statistics of each section in milliseconds, sorted by section name."""
+    result: Dict[str, Dict[str, Any]] = {}
+    for name in sorted(samples):
+        ms: NDArray[np.float64] = np.array(samples[name], dtype=np.float64) * 1000
+        if not ms.size:
+            continue
+        histogram, _ = np.histogram(ms, bins=HISTOGRAM_EDGES_MS)
+        result[name] = {
+            "count": int(ms.size),
+            "mean": float(ms.mean()),
+            "p50": float(np.percentile(ms, 50)),
+            "p95": float(np.percentile(ms, 95)),
+            "max": float(ms.max()),
+            "histogram": histogram.tolist(),
+        }
+    return result
+
+
+def export(filename: str) -> None:
+    """Append the current statistics to `filename` as a single JSON line.
+
+    Each histogram count is of the samples from its lower edge in `histogram_edges_ms` up to the next edge.
+    """
+    record = {
+        "time": time.time(),
+        "histogram_edges_ms": HISTOGRAM_EDGES_MS[:-1],
+        "sections": summary(),
+        "counters": counters,
+    }
+    with open(filename, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def render_overlay(console: tcod.Console, x: int, y: int) -> None:
+    """Render a table of the mean and 95th percentile time of each section at `x`, `y`."""
+    lines = [f"{'section':<18}{'mean':>6}{'p95':>6}"]
+    for name, stats in summary().items():
+        lines.append(f"{name[:18]:<18}{stats['mean']:>6.2f}{stats['p95']:>6.2f}")
+    width = max(len(line) for line in lines)
+    console.draw_rect(x, y, width, len(lines), 0x20, game.color.white, game.color.black)
+    for i, line in enumerate(lines):
+        console.print(x, y + i, line, fg=game.color.white if i else game.color.menu_title)
@@ -1,48 +1,137 @@
 from __future__ import annotations
 
+from typing import Any, Tuple
+
 import numpy as np
 import tcod
+from numpy.typing import NDArray
 
 import g
 import game.constants
 import game.engine
 import game.game_map
+import game.profiler
 import game.render_functions
 from game.tiles import tile_graphics
 
+FIRE_GRAPHIC = (ord("^"), (255, 255, 255), (0xCC, 0x22, 0))
 
-def render_map(console: tcod.Console, gamemap: game.game_map.GameMap) -> None:
-    # The default graphics are of tiles that are visible.
-    light = tile_graphics[gamemap.tiles]
-    light[gamemap.fire > 0] = (ord("^"), (255, 255, 255), (0xCC, 0x22, 0))
+GLYPH_DTYPE = np.dtype([("x", np.intp), ("y", np.intp), ("ch", np.int32), ("fg", "3u1")])
+"""The entity glyphs drawn over the map."""
+
+
+class MapRenderCache:
+    """The last composed frame of a GameMap, with the tiles which need to be composed again."""
+
+    def __init__(self, gamemap: game.game_map.GameMap):
+        self.frame: NDArray[Any] = np.zeros((gamemap.width, gamemap.height), dtype=tcod.console.rgb_graphic, order="F")
+        self.dirty: NDArray[np.bool_] = np.ones((gamemap.width, gamemap.height), dtype=bool, order="F")
+        self.any_dirty = True
+        self.fullbright = g.fullbright
+        self.glyphs: NDArray[Any] = np.zeros(0, dtype=GLYPH_DTYPE)  # The entity glyphs drawn on the last frame.
+        self.dark = _darken(gamemap.memory)  # The remembered tiles as they are shown outside of the FOV.
+        self.region: Tuple[slice, slice] = (slice(0, 0), slice(0, 0))  # The area composed on the last frame.
+
+    def mark(self, where: Any) -> None:
+        """Mark the tiles at `where` as needing to be composed again."""
+        if isinstance(where, np.ndarray) and where.dtype == np.bool_ and not where.any():
+            return  # An empty mask, such as from a turn where no fire started or went out.
+        self.dirty[where] = True
+        self.any_dirty = True
 
-    # Apply effects to create a darkened map of tile graphics.
-    dark = gamemap.memory.copy()
+
+def _darken(graphics: NDArray[Any]) -> NDArray[Any]:
+    """Apply effects to create a darkened copy of tile graphics."""
+    dark: NDArray[Any] = graphics.copy()
     dark["fg"] //= 2
     dark["bg"] //= 8
+    return dark
 
-    visible = gamemap.visible
-    if g.fullbright:
-        visible = np.ones_like(visible)
 
-    for entity in sorted(gamemap.entities, key=lambda x: x.render_order.value):
-        if not visible[entity.x, entity.y]:
-            continue  # Skip entities that are not in the FOV.
-        light[entity.x, entity.y]["ch"] = ord(entity.char)
-        light[entity.x, entity.y]["fg"] = entity.color
+def _compose(
+    gamemap: game.game_map.GameMap, cache: MapRenderCache, visible: NDArray[np.bool_], region: Tuple[slice, slice]
+) -> None:
+    """Compose the dirty tiles of the cached frame within `region`."""
+    x_index, y_index = np.nonzero(cache.dirty[region])
+    index = x_index + region[0].start, y_index + region[1].start
+    is_visible = visible[index]
 
-    console.rgb[0 : gamemap.width, 0 : gamemap.height] = np.select(
-        condlist=[visible, gamemap.explored],
-        choicelist=[light, dark],
-        default=dark,
+    # The default graphics are of tiles that are visible.
+    light = tile_graphics[gamemap.tiles[index]]
+    light[gamemap.fire[index] > 0] = FIRE_GRAPHIC
+
+    cache.frame[index] = np.where(is_visible, light, cache.dark[index])
+    cache.dirty[index] = False
+    cache.any_dirty = False
+    cache.region = region
+
+
+def _union(a: Tuple[slice, slice], b: Tuple[slice, slice]) -> Tuple[slice, slice]:
+    """Return the bounding box of two 2D slices."""
+    return (
+        slice(min(a[0].start, b[0].start), max(a[0].stop, b[0].stop)),
+        slice(min(a[1].start, b[1].start), max(a[1].stop, b[1].stop)),
     )
 
-    for entity in sorted(gamemap.entities, key=lambda x: x.render_order.value):
-        if not visible[entity.x, entity.y]:
-            continue  # Skip entities that are not in the FOV.
-        console.print(entity.x, entity.y, entity.char, fg=entity.color)
 
-    visible.choose((gamemap.memory, light), out=gamemap.memory)
+def _visible_glyphs(gamemap: game.game_map.GameMap, visible: NDArray[np.bool_]) -> NDArray[Any]:
+    """Return the glyphs of the visible entities, with only the top entity of each tile."""
+    glyphs = np.array(
+        [
+            (entity.x, entity.y, ord(entity.char), entity.color)
+            for entity in sorted(gamemap.entities, key=lambda x: x.render_order.value)
+        ],
+        dtype=GLYPH_DTYPE,
+    )
+    glyphs = glyphs[visible[glyphs["x"], glyphs["y"]]]  # Skip entities that are not in the FOV.
+    # Keep the last glyph drawn on each tile, which is the one with the highest render order.
+    _, last = np.unique((glyphs["x"] * gamemap.height + glyphs["y"])[::-1], return_index=True)
+    top: NDArray[Any] = glyphs[np.sort(len(glyphs) - 1 - last)]
+    return top
+
+
+def render_map(console: tcod.Console, gamemap: game.game_map.GameMap, camera: Tuple[int, int] = (0, 0)) -> None:
+    """Render the map view with its top-left corner at the `camera` map position."""
+    cache = gamemap.render_cache
+    if cache is None:
+        cache = gamemap.render_cache = MapRenderCache(gamemap)
+
+    cam_x, cam_y = camera
+    view = (
+        slice(cam_x, min(cam_x + game.constants.map_view_width, gamemap.width)),
+        slice(cam_y, min(cam_y + game.constants.map_view_height, gamemap.height)),
+    )
+    # Tiles in view are drawn, and tiles in the FOV must be composed to be remembered.
+    region = _union(view, gamemap.fov_window)
+
+    visible = gamemap.visible
+    if g.fullbright:
+        visible = np.ones_like(visible)
+    if cache.fullbright != g.fullbright:
+        cache.fullbright = g.fullbright
+        cache.mark(...)
+
+    glyphs = _visible_glyphs(gamemap, visible)
+    if not np.array_equal(glyphs, cache.glyphs):
+        # Redraw where entities were and where they are now.
+        cache.mark((cache.glyphs["x"], cache.glyphs["y"]))
+        cache.mark((glyphs["x"], glyphs["y"]))
+
+    if cache.any_dirty or cache.region != region:
+        redrawn = cache.dirty[region] & visible[region]
+        _compose(gamemap, cache, visible, region)
+        overlay = cache.frame[glyphs["x"], glyphs["y"]]
+        overlay["ch"] = glyphs["ch"]
+        overlay["fg"] = glyphs["fg"]
+        cache.frame[glyphs["x"], glyphs["y"]] = overlay
+        # Remember the visible tiles which were redrawn, including the entities on them.
+        remembered = cache.frame[region][redrawn]
+        gamemap.memory[region][redrawn] = remembered
+        cache.dark[region][redrawn] = _darken(remembered)
+    cache.glyphs = glyphs
+
+    frame = cache.frame[view]
+    console.rgb[0 : frame.shape[0], 0 : frame.shape[1]] = frame
 
 
 def render_ui(console: tcod.Console, engine: game.engine.Engine) -> None:
@@ -67,8 +156,12 @@ def render_ui(console: tcod.Console, engine: game.engine.Engine) -> None:
     game.render_functions.render_names_at_mouse_location(console=console, x=UI_LEFT, y=1, engine=engine)
 
     if g.mouse_pos:
-        console.rgb[g.mouse_pos]["fg"] = (0, 0, 0)
-        console.rgb[g.mouse_pos]["bg"] = (255, 255, 255)
+        cam_x, cam_y = engine.camera
+        mouse_x, mouse_y = g.mouse_pos[0] - cam_x, g.mouse_pos[1] - cam_y
+        # The camera may have moved since the mouse did, leaving the position out of view.
+        if 0 <= mouse_x < game.constants.map_view_width and 0 <= mouse_y < game.constants.map_view_height:
+            console.rgb[mouse_x, mouse_y]["fg"] = (0, 0, 0)
+            console.rgb[mouse_x, mouse_y]["bg"] = (255, 255, 255)
         if g.fullbright or engine.game_map.visible[g.mouse_pos]:
             console.print(
                 UI_LEFT,
@@ -76,3 +169,7 @@ def render_ui(console: tcod.Console, engine: game.engine.Engine) -> None:
                 f"Fire={engine.game_map.fire[g.mouse_pos]}, Heat={engine.game_map.heat[g.mouse_pos]}, "
                 f"Smoke={engine.game_map.smoke[g.mouse_pos]},\nFuel={engine.game_map.fuel[g.mouse_pos]}",
             )
+
+    if game.profiler.enabled:
+        # Drawn over the right edge of the map view, next to the mouse tooltip.
+        game.profiler.render_overlay(console, UI_LEFT - 30, 0)
@@ -3,6 +3,7 @@
 
 import copy
 import lzma
+import os
 import pickle
 import random
 import traceback
@@ -12,6 +13,7 @@
 
 import g
 import game.color
+import game.constants
 import game.engine
 import game.entity_factories
 import game.game_map
@@ -21,8 +23,20 @@
 from game.input_handlers import BaseEventHandler
 
 
-def new_game() -> game.engine.Engine:
-    """Return a brand new game session as an Engine instance."""
+def new_game(
+    seed: Optional[int] = None, *, history: bool = True, pregenerate_floors: Optional[bool] = None
+) -> game.engine.Engine:
+    """Return a brand new game session as an Engine instance.
+
+    The dungeon and the engine RNG are seeded with `seed` if it is given, otherwise a game prefilled by
+    game.wfc_cache is used if there is one.
+    If `history` is False then the message history is only kept in memory instead of being written to a file.
+    `pregenerate_floors` defaults to `constants.pregenerate_floors`.
+    """
+    if seed is None:
+        seed = game.procgen.take_prefilled_seed(map_width, map_height)
+    if seed is None:
+        seed = random.getrandbits(64)
     engine = game.engine.Engine()
     engine.game_world = game.game_map.GameWorld(
         engine=engine,
@@ -31,8 +45,12 @@ def new_game() -> game.engine.Engine:
         room_max_size=room_max_size,
         map_width=map_width,
         map_height=map_height,
+        seed=seed,
+        pregenerate_floors=game.constants.pregenerate_floors if pregenerate_floors is None else pregenerate_floors,
     )
-    engine.rng = random.Random()
+    engine.rng = random.Random(seed)
+    if history:
+        engine.message_log.start_history(os.path.join(game.constants.message_history_dir, f"{seed:x}.jsonl"))
     engine.game_world.generate_floor()
     engine.player = game.entity_factories.player.spawn(engine.game_map, *engine.game_map.enter_xy)
     engine.update_fov()
@@ -9,10 +9,19 @@
 
 CARDINAL: NDArray[np.int8] = np.asarray([[0, 1, 0], [1, 1, 1], [0, 1, 0]], dtype=np.int8)
 
+HAZARD_FIRE = 40  # Path cost of entering a burning tile, on top of the fire intensity.
+HAZARD_HEAT_DIVISOR = 25  # Heat is divided by this to get its path cost.
+HAZARD_SMOKE_DIVISOR = 10  # Smoke is divided by this to get its path cost.
+HAZARD_MAX = 100
+
 
 def fire_step(gamemap: game.game_map.GameMap) -> None:
+    was_burning = gamemap.fire > 0
     exhaused = (gamemap.fire != 0) & (gamemap.fuel <= gamemap.fire)
-    gamemap.tiles[exhaused] = 1
+    burnt_out = exhaused & (gamemap.tiles != 1)
+    if burnt_out.any():
+        gamemap.tiles[burnt_out] = 1
+        gamemap.tiles_changed(burnt_out)
 
     gamemap.fuel[:] -= gamemap.fire
     gamemap.fuel.clip(min=0, out=gamemap.fuel)
@@ -30,9 +39,24 @@ def fire_step(gamemap: game.game_map.GameMap) -> None:
     max_fire[gamemap.fuel == 0] = 0
     max_fire.clip(max=100, out=max_fire)
     gamemap.fire.clip(max=max_fire, out=gamemap.fire)
+    gamemap.fire_changed(was_burning != (gamemap.fire > 0))
 
     for obj in gamemap.entities:
         if not isinstance(obj, game.entity.Actor):
             continue
         damage = gamemap.fire[obj.x, obj.y]
         game.combat.apply_damage(obj.fighter, damage)
+
+    update_hazard(gamemap)
+
+
+def update_hazard(gamemap: game.game_map.GameMap) -> None:
+    """Recompute the path cost of hazards from the fire, heat, and smoke of a map.
+
+    This is done once per turn so that pathfinding can add `gamemap.hazard` to its costs without any extra work.
+    """
+    hazard = gamemap.hazard
+    np.floor_divide(gamemap.heat, HAZARD_HEAT_DIVISOR, out=hazard)
+    hazard += gamemap.smoke // HAZARD_SMOKE_DIVISOR
+    hazard += (gamemap.fire + HAZARD_FIRE) * (gamemap.fire > 0)
+    hazard.clip(0, HAZARD_MAX, out=hazard)
@@ -18,3 +18,4 @@
 
 tile_fuel: NDArray[np.int32] = np.array([8000, 24000, 0, 3000])
 fire_resist: NDArray[np.int32] = np.array([2000, 0, 0, 0])
+tile_transparent: NDArray[np.bool_] = np.array([False, True, True, True])
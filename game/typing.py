@@ -19,6 +19,10 @@ def handle_events(self, event: tcod.event.Event) -> EventHandler:
     def on_render(self, console: tcod.Console) -> None:
         ...
 
+    def on_tick(self) -> EventHandler:
+        """Advance the real-time simulation by one tick and return the next active event handler."""
+        ...
+
 
 ActionOrHandler = Union[Action, EventHandler]
 """An event handler return value which can trigger an action or switch active handlers.
@@ -0,0 +1,225 @@
+"""An on-disk cache of wave function collapse output.
+
+Results are stored as .npy files named by a hash of the sample image, the WFC options and the seed.
+The least recently used results are removed once the cache is larger than `constants.wfc_cache_max_bytes`.
+
+The floors of whole games can also be generated ahead of time.  The seeds of these games are recorded, and new games
+take an unused recorded seed before drawing a random one, so that their floors are already cached:
+
+    python -m game.wfc_cache --games 5 --floors 10 --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import random
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import wfc.wfc_control
+from numpy.typing import NDArray
+
+import game.constants
+import game.profiler
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+"""Changing this invalidates all existing cache entries."""
+
+
+def options_key(image: NDArray[np.uint8], options: Any) -> str:
+    """Return a hash of a sample image and the WFC options used with it."""
+    h = hashlib.sha256()
+    h.update(json.dumps([CACHE_VERSION, image.shape, str(image.dtype), options], sort_keys=True).encode())
+    h.update(np.ascontiguousarray(image).tobytes())
+    return h.hexdigest()
+
+
+def _cache_dir() -> Path:
+    return Path(game.constants.wfc_cache_dir)
+
+
+def _cache_path(image: NDArray[np.uint8], seed: int, options: Any) -> Path:
+    return _cache_dir() / f"{options_key(image, options)[:32]}-{seed}.npy"
+
+
+def _load(path: Path) -> Optional[NDArray[np.uint8]]:
+    """Load a cached result, returns None if it's missing or unreadable."""
+    try:
+        result: NDArray[np.uint8] = np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    os.utime(path)  # Mark as recently used.
+    return result
+
+
+def _save(path: Path, result: NDArray[np.uint8]) -> None:
+    """Write a result atomically, so that other processes never read a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f"{uuid.uuid4().hex}.tmp")
+    with open(temp_path, "wb") as f:
+        np.save(f, result, allow_pickle=False)
+    os.replace(temp_path, path)
+
+
+def evict(max_bytes: int) -> int:
+    """Remove the least recently used cache entries until the cache is no larger than `max_bytes`.
+
+    Returns the size of the remaining entries.
+    """
+    entries = []
+    for path in _cache_dir().glob("*.npy"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
+
+
+_cache_bytes: Optional[int] = None
+"""The estimated size of the cache, None until it's measured by the first write of this process."""
+
+
+def _added(size: int) -> None:
+    """Track a new cache entry of `size` bytes, the cache is only scanned for eviction once it's estimated to be full.
+
+    Entries written by other processes are not counted until the next scan.
+    """
+    global _cache_bytes
+    max_bytes = game.constants.wfc_cache_max_bytes
+    if _cache_bytes is None or _cache_bytes + size > max_bytes:
+        _cache_bytes = evict(max_bytes)
+    else:
+        _cache_bytes += size
+
+
+def _run_wfc(image: NDArray[np.uint8], seed: int, options: Any) -> NDArray[np.uint8]:
+    """Run WFC with the global random generators seeded with `seed`, their previous states are restored afterwards."""
+    random_state = random.getstate()
+    np_random_state = np.random.get_state()
+    try:
+        random.seed(seed)
+        np.random.seed(seed)
+        result: NDArray[np.uint8] = wfc.wfc_control.execute_wfc(image=image, **options)
+    finally:
+        random.setstate(random_state)
+        np.random.set_state(np_random_state)
+    return result
+
+
+def execute_wfc(image: NDArray[np.uint8], *, seed: Optional[int], **options: Any) -> NDArray[np.uint8]:
+    """Return the result of `wfc.wfc_control.execute_wfc` for a sample image.
+
+    If `seed` is None then WFC is always run.  Otherwise the result is taken from the cache, or WFC is run with
+    `seed` and the result is cached.
+    """
+    if seed is None:
+        result: NDArray[np.uint8] = wfc.wfc_control.execute_wfc(image=image, **options)
+        return result
+    path = _cache_path(image, seed, options)
+    cached = _load(path)
+    if cached is not None:
+        game.profiler.count("wfc.cache_hits")
+        return cached
+    game.profiler.count("wfc.runs")
+    result = _run_wfc(image, seed, options)
+    try:
+        _save(path, result)
+        _added(result.nbytes)
+    except OSError:
+        logger.exception("Could not write to the WFC cache.")
+    return result
+
+
+def _seeds_dir(image: NDArray[np.uint8], options: Any) -> Path:
+    return _cache_dir() / "seeds" / options_key(image, options)[:32]
+
+
+def _prefill_entry(image: NDArray[np.uint8], seed: int, options: Any) -> None:
+    """Generate and cache the layout of one seed, unless it's already cached."""
+    path = _cache_path(image, seed, options)
+    if not path.exists():
+        _save(path, _run_wfc(image, seed, options))
+
+
+def prefill(
+    image: NDArray[np.uint8],
+    game_seeds: Dict[int, Iterable[int]],
+    workers: Optional[int] = None,
+    **options: Any,
+) -> None:
+    """Cache layouts ahead of time using `workers` processes.
+
+    `game_seeds` maps each game seed to the WFC seeds of its layouts.  A game seed is recorded for `take_game_seed`
+    once all of its layouts are cached.
+    """
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = {
+            game_seed: [executor.submit(_prefill_entry, image, seed, options) for seed in seeds]
+            for game_seed, seeds in game_seeds.items()
+        }
+        for game_seed, game_futures in futures.items():
+            for future in game_futures:
+                future.result()
+            seed_path = _seeds_dir(image, options) / str(game_seed)
+            seed_path.parent.mkdir(parents=True, exist_ok=True)
+            seed_path.touch()
+    evict(game.constants.wfc_cache_max_bytes)
+
+
+def take_game_seed(image: NDArray[np.uint8], **options: Any) -> Optional[int]:
+    """Remove and return a game seed recorded by `prefill` with the same options, returns None if there are none."""
+    seeds_dir = _seeds_dir(image, options)
+    if not seeds_dir.is_dir():
+        return None
+    for path in sorted(seeds_dir.iterdir()):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            continue  # Taken by another process.
+        try:
+            return int(path.name)
+        except ValueError:
+            continue
+    return None
+
+
+def main() -> None:
+    import game.procgen
+
+    parser = argparse.ArgumentParser(description="Generate the dungeon layouts of new games ahead of time.")
+    parser.add_argument("--games", type=int, default=5, help="Number of games to generate.")
+    parser.add_argument("--floors", type=int, default=10, help="Number of floors of each game, starting from floor 1.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes, defaults to the CPU count.")
+    parser.add_argument("--width", type=int, default=game.constants.map_width)
+    parser.add_argument("--height", type=int, default=game.constants.map_height)
+    args = parser.parse_args()
+    floors = range(1, args.floors + 1)
+    game_seeds = [random.getrandbits(64) for _ in range(args.games)]
+    prefill(
+        game.procgen.load_pattern(game.procgen.WFC_PATTERN),
+        {game_seed: [game.procgen.layout_seed(game_seed, floor) for floor in floors] for game_seed in game_seeds},
+        args.workers,
+        **game.procgen.layout_options(args.width, args.height),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
+import argparse
 import logging
+import multiprocessing
+import time
 import traceback
 
+import numpy as np
 import tcod
 
+import g
 import game.color
+import game.constants
 import game.engine
 import game.entity
 import game.exceptions
 import game.input_handlers
+import game.message_log
 import game.procgen
+import game.profiler
 import game.setup_game
 import game.typing
 from game.constants import screen_height, screen_width
@@ -19,10 +27,19 @@ def save_game(handler: game.typing.EventHandler, filename: str) -> None:
     """If the current event handler has an active Engine then save it."""
     if isinstance(handler, game.input_handlers.EventHandler):
         handler.engine.save_as(filename)
+        # There is only one save, so the histories of any other games are no longer needed.
+        game.message_log.remove_histories(
+            game.constants.message_history_dir, keep=handler.engine.message_log.history_path
+        )
         print("Game saved.")
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Yet Another Roguelike Tutorial")
+    parser.add_argument("--realtime", action="store_true", help="Simulate fire and smoke in real-time.")
+    args = parser.parse_args()
+    g.realtime = args.realtime
+
     tileset = tcod.tileset.load_tilesheet("data/dejavu16x16_gs_tc.png", 32, 8, tcod.tileset.CHARMAP_TCOD)
 
     event_handler: game.typing.EventHandler = game.setup_game.MainMenu()
@@ -35,16 +52,47 @@ def main() -> None:
         vsync=True,
     ) as context:
         root_console = tcod.Console(screen_width, screen_height, order="F")
+        presented = np.zeros_like(root_console.rgba)  # The last frame sent to the window.
+        force_present = True
+        # Real-time mode schedules, as times from time.perf_counter.
+        tick_length = 1 / game.constants.tick_rate
+        frame_length = 1 / game.constants.max_fps
+        next_tick = next_frame = time.perf_counter()
         try:
             while True:
-                root_console.clear()
-                event_handler.on_render(console=root_console)
-                context.present(root_console)
+                if not g.realtime or time.perf_counter() >= next_frame:
+                    next_frame = max(next_frame + frame_length, time.perf_counter())
+                    with game.profiler.section("frame"):
+                        root_console.clear()
+                        event_handler.on_render(console=root_console)
+                    # Skip presenting frames identical to the last one, unless the window needs to be redrawn.
+                    if force_present or not np.array_equal(root_console.rgba, presented):
+                        with game.profiler.section("present"):
+                            context.present(root_console)
+                        presented[...] = root_console.rgba
+                    force_present = False
 
                 try:
-                    for event in tcod.event.wait():
-                        context.convert_event(event)
-                        event_handler = event_handler.handle_events(event)
+                    # In real-time mode, wait for events only until the next tick or frame is due.
+                    timeout = max(0.0, min(next_tick, next_frame) - time.perf_counter()) if g.realtime else None
+                    for event in game.input_handlers.coalesce_events(tcod.event.wait(timeout)):
+                        if isinstance(event, tcod.event.WindowEvent):
+                            force_present = True
+                        if isinstance(event, tcod.event.MouseState):
+                            context.convert_event(event)  # Only mouse events have positions to convert.
+                        with game.profiler.section("events"):
+                            event_handler = event_handler.handle_events(event)
+                    if g.realtime:
+                        # Run every tick which is due before the next frame, frames are dropped instead of ticks.
+                        due = int((time.perf_counter() - next_tick) // tick_length) + 1
+                        if due > game.constants.max_catchup_ticks:
+                            skipped = due - game.constants.max_catchup_ticks
+                            logging.warning("Simulation is behind, skipped %i ticks.", skipped)
+                            next_tick += skipped * tick_length
+                            due -= skipped
+                        for _ in range(due):
+                            event_handler = event_handler.on_tick()
+                            next_tick += tick_length
                 except Exception:  # Handle exceptions in game.
                     traceback.print_exc()  # Print error to stderr.
                     # Then print the error to the message log.
@@ -61,6 +109,7 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Floors are generated in other processes.
     if __debug__:
         logging.basicConfig(level=logging.DEBUG)
     main()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from typing import List
+
+import tcod
+
+import game.engine  # noqa: F401  # isort: skip  # Imported first to avoid a circular import.
+from game.input_handlers import coalesce_events
+
+
+def kept(events: List[tcod.event.Event]) -> List[int]:
+    """Return the indexes of the events kept by `coalesce_events`, in the order they are returned."""
+    return [next(i for i, event in enumerate(events) if event is result) for result in coalesce_events(events)]
+
+
+def motion(x: int, y: int) -> tcod.event.MouseMotion:
+    return tcod.event.MouseMotion(tile=tcod.event.Point(x, y))
+
+
+def key(sym: int, repeat: bool = False) -> tcod.event.KeyDown:
+    return tcod.event.KeyDown(
+        scancode=tcod.event.Scancode.UNKNOWN, sym=tcod.event.KeySym(sym), mod=tcod.event.Modifier.NONE, repeat=repeat
+    )
+
+
+def test_only_last_mouse_motion_is_kept() -> None:
+    click = tcod.event.MouseButtonDown(tile=tcod.event.Point(2, 2), button=tcod.event.MouseButton.LEFT)
+    events: List[tcod.event.Event] = [motion(0, 0), motion(1, 1), click, motion(3, 3), motion(4, 4)]
+    assert kept(events) == [2, 4]
+
+
+def test_runs_of_one_repeated_key_are_reduced_to_the_last_repeat() -> None:
+    events: List[tcod.event.Event] = [
+        key(tcod.event.K_a),
+        key(tcod.event.K_a, True),
+        key(tcod.event.K_a, True),
+        key(tcod.event.K_a, True),
+        key(tcod.event.K_b),
+    ]
+    assert kept(events) == [0, 3, 4]
+
+
+def test_repeats_of_different_keys_are_kept() -> None:
+    events: List[tcod.event.Event] = [
+        key(tcod.event.K_a, True),
+        key(tcod.event.K_b, True),
+        key(tcod.event.K_a, True),
+        key(tcod.event.K_a, True),
+        key(tcod.event.K_a),
+    ]
+    assert kept(events) == [0, 1, 3, 4]
+
+
+def test_text_input_is_dropped() -> None:
+    events: List[tcod.event.Event] = [
+        key(tcod.event.K_a),
+        tcod.event.TextInput(text="a"),
+        key(tcod.event.K_b),
+        tcod.event.TextInput(text="b"),
+    ]
+    assert kept(events) == [0, 2]
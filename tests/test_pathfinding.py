@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from numpy.typing import NDArray
+
+import game.engine  # isort: skip  # Imported first to avoid a circular import.
+import game.game_map
+import game.pathfinding
+
+
+def corridor_map() -> game.game_map.GameMap:
+    """Return a 48x16 map with a single corridor along y=8, crossing cluster borders at x=15/16 and x=31/32."""
+    gamemap = game.game_map.GameMap(game.engine.Engine(), 48, 16)
+    gamemap.tiles[:, 8] = 1
+    return gamemap
+
+
+@pytest.mark.parametrize("start", [(10, 8), (15, 8), (16, 8), (31, 8), (32, 8)])
+def test_path_from_and_to_portals(start: game.pathfinding.Position) -> None:
+    gamemap = corridor_map()
+    graph = game.pathfinding.ClusterGraph(gamemap)
+
+    def cost(window: game.pathfinding.Window) -> NDArray[np.int32]:
+        return gamemap.tiles[window].astype(np.int32)
+
+    goal = (40, 8)
+    assert graph.path_to(start, goal, cost) == [(x, 8) for x in range(start[0] + 1, goal[0] + 1)]
+    assert graph.path_to(goal, start, cost) == [(x, 8) for x in range(goal[0] - 1, start[0] - 1, -1)]
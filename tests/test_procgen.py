@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+import scipy.ndimage  # type: ignore
+from numpy.typing import NDArray
+
+import game.engine  # isort: skip  # Imported first to avoid a circular import.
+import game.game_map
+import game.procgen
+import game.procgen_benchmark
+from game.procgen import FLOOR, OUTDOORS, WALL
+
+CARDINAL = [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
+
+
+def make_map(rows: List[str]) -> game.game_map.GameMap:
+    """Return a map from rows of text, where `#` is wall, `.` is outdoors and `1` is indoor floor."""
+    chars = np.array([list(row) for row in rows]).T
+    gamemap = game.game_map.GameMap(game.engine.Engine(), *chars.shape)
+    gamemap.tiles[chars == "#"] = WALL
+    gamemap.tiles[chars == "."] = OUTDOORS
+    gamemap.tiles[chars == "1"] = FLOOR
+    gamemap.tiles_changed(np.s_[:, :])
+    return gamemap
+
+
+def open_areas(tiles: NDArray[np.uint8]) -> int:
+    """Return the number of separate open areas of a map."""
+    _, count = scipy.ndimage.label(tiles != WALL, structure=CARDINAL)
+    return int(count)
+
+
+def assert_only_walls_carved(before: NDArray[np.uint8], after: NDArray[np.uint8]) -> None:
+    changed = before != after
+    assert (before[changed] == WALL).all()
+    assert (after[changed] == FLOOR).all()
+
+
+def test_isolated_rooms_are_connected_to_outdoors() -> None:
+    gamemap = make_map(
+        [
+            "....................",
+            ".#####......######..",
+            ".#111#......#1111#..",
+            ".#111#..##..#1111#..",
+            ".#####..##..######..",
+            "........##..........",
+            "#########...#######.",
+            "#1111111#...#11#11#.",
+            "#1111111#...#11#11#.",
+            "#########...#######.",
+        ]
+    )
+    before = gamemap.tiles.copy()
+    game.procgen.connect_indoor_areas(gamemap)
+    assert_only_walls_carved(before, gamemap.tiles)
+    assert game.procgen_benchmark.reachable_indoor_share(gamemap) == 1.0
+    assert open_areas(gamemap.tiles) == 1
+
+
+def test_rooms_without_outdoors_are_connected_to_each_other() -> None:
+    gamemap = make_map(
+        [
+            "##########",
+            "#11##11#1#",
+            "#11##11###",
+            "##########",
+            "#111#1111#",
+            "##########",
+        ]
+    )
+    before = gamemap.tiles.copy()
+    game.procgen.connect_indoor_areas(gamemap)
+    assert_only_walls_carved(before, gamemap.tiles)
+    assert open_areas(gamemap.tiles) == 1
+
+
+def test_connected_map_is_unchanged() -> None:
+    gamemap = make_map(
+        [
+            "..........",
+            ".####.###.",
+            ".#11111#..",
+            ".#11#11#..",
+            ".#######..",
+        ]
+    )
+    before = gamemap.tiles.copy()
+    game.procgen.connect_indoor_areas(gamemap)
+    assert np.array_equal(gamemap.tiles, before)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import random
+from typing import Any, Iterator
+
+import numpy as np
+import pytest
+from numpy.typing import NDArray
+
+import game.engine  # isort: skip  # Imported first to avoid a circular import.
+import game.actions
+import game.constants
+import game.entity_factories
+import game.game_map
+import game.headless
+import game.input_handlers
+import game.tiles
+from game.rendering import FIRE_GRAPHIC
+
+
+def make_engine(size: int, seed: int) -> game.engine.Engine:
+    """Return an engine on a random map of scattered walls, fires and orcs."""
+    rng = np.random.default_rng(seed)
+    engine = game.engine.Engine()
+    engine.rng = random.Random(seed)
+    gamemap = game.game_map.GameMap(engine, size, size)
+    gamemap.parent = engine
+    engine.game_map = gamemap
+    gamemap.tiles[:] = 1
+    gamemap.tiles[rng.random((size, size)) < 0.15] = 0
+    gamemap.tiles_changed(np.s_[:, :])
+    gamemap.fuel = game.tiles.tile_fuel[gamemap.tiles]
+    for x, y in rng.integers(0, size, (size // 10, 2)).tolist():
+        gamemap.fire[x, y] = 20
+        gamemap.fuel[x, y] += 200
+    center = size // 2
+    gamemap.tiles[center, center] = 1
+    engine.player = game.entity_factories.player.spawn(gamemap, center, center)
+    engine.player.fighter.max_hp = engine.player.fighter.hp = 1_000_000  # Survive the fires and orcs.
+    for x, y in rng.integers(0, size, (size // 5, 2)).tolist():
+        if gamemap.tiles[x, y] and (x, y) != (center, center):
+            game.entity_factories.orc.spawn(gamemap, x, y)
+    engine.update_fov()
+    return engine
+
+
+def compose_baseline(gamemap: game.game_map.GameMap, memory: NDArray[Any]) -> NDArray[Any]:
+    """Compose the whole map without any caching, updating `memory` with the visible tiles."""
+    light = game.tiles.tile_graphics[gamemap.tiles]
+    light[gamemap.fire > 0] = FIRE_GRAPHIC
+    for entity in sorted(gamemap.entities, key=lambda x: x.render_order.value):
+        if gamemap.visible[entity.x, entity.y]:
+            light[entity.x, entity.y]["ch"] = ord(entity.char)
+            light[entity.x, entity.y]["fg"] = entity.color
+    dark = memory.copy()
+    dark["fg"] //= 2
+    dark["bg"] //= 8
+    frame: NDArray[Any] = np.select([gamemap.visible, gamemap.explored], [light, dark], default=dark)
+    gamemap.visible.choose((memory, light), out=memory)
+    return frame
+
+
+def walk(headless: game.headless.Headless, turns: int) -> Iterator[int]:
+    """Move the player randomly for a number of turns, yielding after each turn."""
+    rng = random.Random(0)
+    for turn in range(turns):
+        assert headless.engine.player.is_alive
+        np.random.seed(turn)  # Fire spread is random.
+        dx, dy = rng.choice(game.headless.DIRECTIONS)
+        headless.act(game.actions.Bump(headless.engine.player, dx, dy))
+        yield turn
+
+
+@pytest.mark.parametrize("size", [50, 150])
+@pytest.mark.parametrize("fov_radius", [0, 10])
+def test_render_map_matches_baseline(monkeypatch: pytest.MonkeyPatch, size: int, fov_radius: int) -> None:
+    monkeypatch.setattr(game.constants, "fov_radius", fov_radius)
+    engine = make_engine(size, seed=1)
+    headless = game.headless.Headless(game.input_handlers.MainGameEventHandler(engine), render=False)
+    memory = engine.game_map.memory.copy()
+    view_width = min(size, game.constants.map_view_width)
+    view_height = min(size, game.constants.map_view_height)
+    for turn in walk(headless, 300):
+        frame = headless.frame()
+        expected = compose_baseline(engine.game_map, memory)
+        cam_x, cam_y = engine.camera
+        expected_view = expected[cam_x : cam_x + view_width, cam_y : cam_y + view_height]
+        assert np.array_equal(frame[:view_width, :view_height], expected_view), f"Frame differs on turn {turn}."
+        assert np.array_equal(engine.game_map.memory, memory), f"Memory differs on turn {turn}."